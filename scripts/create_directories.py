@@ -1,6 +1,7 @@
 import pandas as pd
 import os
 from collections import defaultdict
+from functools import lru_cache
 import re
 import unicodedata
 
@@ -12,19 +13,21 @@ PAPERS_PATH = os.path.join(BASE_PATH, "papers")
 # Method names
 METHODS = ['grampa', 'padre', 'polyphest', 'mpallop', 'mpl', 'allopnet']
 
+# Leaf directories created under every paper directory
+PAPER_LEAF_DIRS = ['genes', 'gene_trees'] + [os.path.join('networks', method) for method in METHODS]
+
 # Read the CSV file
 df = pd.read_csv(CSV_PATH)
 
 # Dictionary to track authors/years for lettering
 author_year_count = defaultdict(int)
 
+@lru_cache(maxsize=None)
 def normalize_name(name):
     """Remove accents and special characters from name"""
-    # Normalize unicode characters
-    normalized = unicodedata.normalize('NFKD', name)
-    # Remove non-ASCII characters but keep basic punctuation
-    normalized = ''.join(c for c in normalized if not unicodedata.combining(c))
-    return normalized
+    # Normalize unicode characters, then drop anything that is not ASCII
+    # (combining accents end up as separate code points after NFKD)
+    return unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
 
 def extract_author_year(paper_text):
     """Extract author and year from paper text."""
@@ -61,20 +64,21 @@ def create_paper_directories(row):
             base_dir += chr(97 + author_year_count[key])
     author_year_count[key] += 1
     
+    # Local names for the directory-creation loop (fast local lookups
+    # instead of global + attribute lookups on every iteration)
+    join, makedirs, mkdir = os.path.join, os.makedirs, os.mkdir
+    
     # Create main paper directory and subdirectories
-    paper_dir = os.path.join(PAPERS_PATH, base_dir)
-    subdirs = ['genes', 'gene_trees', 'networks']
+    paper_dir = join(PAPERS_PATH, base_dir)
     
-    # Create all directories
-    os.makedirs(paper_dir, exist_ok=True)
-    for subdir in subdirs:
-        os.makedirs(os.path.join(paper_dir, subdir), exist_ok=True)
-        
-        # Create method subdirectories in networks
-        if subdir == 'networks':
-            for method in METHODS:
-                method_dir = os.path.join(paper_dir, subdir, method)
-                os.makedirs(method_dir, exist_ok=True)
+    # Parents are known up front, so create them once and then mkdir each
+    # leaf directly (no per-call parent walk as with makedirs)
+    makedirs(paper_dir, exist_ok=True)
+    for leaf in ['networks'] + PAPER_LEAF_DIRS:
+        try:
+            mkdir(join(paper_dir, leaf))
+        except FileExistsError:
+            pass
     
     print(f"Created directory structure for: {base_dir}")
     return base_dir
@@ -31,23 +31,25 @@ def parse_nexus_taxa(nexus_file):
         with open(nexus_file, 'r') as f:
             for line in f:
                 line = line.strip()
+                # Lowercased prefix for keyword checks (avoids copying the whole line)
+                head = line[:16].lower()
                 
                 # Look for TAXA block (traditional format)
-                if line.upper().startswith('BEGIN TAXA'):
+                if head.startswith('begin taxa'):
                     in_taxa_block = True
                     continue
                     
                 # Look for DATA block (your format)
-                if line.upper().startswith('BEGIN DATA'):
+                if head.startswith('begin data'):
                     in_data_block = True
                     continue
                     
                 # End of blocks
-                if line.upper().startswith('END') and (in_taxa_block or in_data_block):
+                if head.startswith('end') and (in_taxa_block or in_data_block):
                     break
                 
                 # Parse TAXLABELS in TAXA block
-                if in_taxa_block and line.upper().startswith('TAXLABELS'):
+                if in_taxa_block and head.startswith('taxlabels'):
                     taxa_line = line[9:].strip()
                     if taxa_line.endswith(';'):
                         taxa_line = taxa_line[:-1]
@@ -62,7 +64,7 @@ def parse_nexus_taxa(nexus_file):
                         taxa.extend(line.split())
                 
                 # Look for MATRIX in DATA block
-                if in_data_block and line.upper().startswith('MATRIX'):
+                if in_data_block and head.startswith('matrix'):
                     in_matrix = True
                     continue
                 
@@ -169,10 +171,15 @@ def extract_species_info(taxa_name, species_field=0, known_species=None):
             if taxa_name.startswith(species + '_') or taxa_name == species:
                 return species
 
-    parts = taxa_name.split('_')
-    if species_field < len(parts):
-        return parts[species_field]
-    return parts[0]
+    # Walk to the requested field with partition() so the rest of the name
+    # is never split; out-of-range fields fall back to the first field
+    first, sep, rest = taxa_name.partition('_')
+    field = first
+    for _ in range(species_field):
+        if not sep:
+            return first
+        field, sep, rest = rest.partition('_')
+    return field
 
 def detect_naming_pattern(taxon_names, separator='_'):
     """Auto-detect naming pattern from taxon names"""
@@ -204,13 +211,14 @@ def find_nexus_files(directory):
     return nexus_files
 
 def get_all_taxa_from_nexus_files(nexus_files):
-    """Get all unique taxa from multiple NEXUS files"""
-    all_taxa = set()
+    """Get all unique taxa from multiple NEXUS files (in first-seen order)"""
+    # dict as an insertion-ordered set keeps the output deterministic
+    all_taxa = {}
     
     print("Reading taxa from NEXUS files:")
     for nexus_file in nexus_files:
         taxa = parse_nexus_taxa(nexus_file)
-        all_taxa.update(taxa)
+        all_taxa.update(dict.fromkeys(taxa))
         print(f"  {os.path.basename(nexus_file)}: {len(taxa)} taxa")
     
     print(f"Total unique taxa across all files: {len(all_taxa)}")
@@ -249,8 +257,12 @@ def assign_polyploid_sequences(sequences, species):
 
     return assignments
 
-def generate_taxa_table(args):
-    """Main function to generate taxa table"""
+def generate_taxa_table(args, nexus_files=None):
+    """Main function to generate taxa table
+
+    nexus_files: Optional pre-resolved list of NEXUS paths (skips re-scanning
+    args.nexus_directory when main() has already listed it)
+    """
     
     # Parse inputs
     copy_counts = parse_copy_numbers(args.copy_numbers)
@@ -260,14 +272,17 @@ def generate_taxa_table(args):
     
     # Get NEXUS files from directory or file list
     if args.nexus_directory:
-        nexus_files = find_nexus_files(args.nexus_directory)
+        if nexus_files is None:
+            nexus_files = find_nexus_files(args.nexus_directory)
         if not nexus_files:
             print(f"Error: No NEXUS files found in directory: {args.nexus_directory}")
             return False
+        # Listed here, also when main() did the scan, so it still follows the
+        # copy number / ploidy loading messages
         print(f"Found {len(nexus_files)} NEXUS files in directory:")
         for nf in nexus_files:
             print(f"  {os.path.basename(nf)}")
-    else:
+    elif nexus_files is None:
         nexus_files = args.nexus_files
     
     # Get all taxa
@@ -290,8 +305,11 @@ def generate_taxa_table(args):
         species = extract_species_info(taxon, args.species_field, known_species)
         species_groups[species].append(taxon)
     
-    # Create taxa table
+    # Create taxa table (summary counts are accumulated as entries are built)
     taxa_entries = []
+    diploid_species = set()
+    polyploid_species = set()
+    missing_sequences = 0
     
     print(f"\n{'='*80}")
     print("GENERATING TAXA TABLE - MODIFIED STRATEGY")
@@ -324,6 +342,7 @@ def generate_taxa_table(args):
                     'individual': f"{species}_ind{i+1}",
                     'genome': 'A'
                 })
+            diploid_species.add(species)
 
         elif copy_num >= 2:
             # POLYPLOID: Strategy depends on number of sequences
@@ -346,6 +365,10 @@ def generate_taxa_table(args):
                     'individual': f"{species}_{individual_id}",
                     'genome': genome
                 })
+                if '_miss' in seq_id:
+                    missing_sequences += 1
+            # Every polyploid assignment includes a genome B entry
+            polyploid_species.add(species)
 
         else:
             # Unsupported copy number
@@ -362,17 +385,7 @@ def generate_taxa_table(args):
             f.write(f"{entry['ID']} {entry['species']} {entry['individual']} {entry['genome']}\n")
     
     # Summary statistics
-    species_count = len(set(e['species'] for e in taxa_entries))
-    diploid_species = set()
-    polyploid_species = set()
-    missing_sequences = sum(1 for e in taxa_entries if '_miss' in e['ID'])
-    
-    for entry in taxa_entries:
-        species = entry['species']
-        if entry['genome'] == 'A' and not any(e['species'] == species and e['genome'] == 'B' for e in taxa_entries):
-            diploid_species.add(species)
-        elif any(e['species'] == species and e['genome'] == 'B' for e in taxa_entries):
-            polyploid_species.add(species)
+    species_count = len(diploid_species) + len(polyploid_species)
     
     print(f"\nSUCCESS: Created taxa table with {len(taxa_entries)} entries")
     print(f"  Species included: {species_count}")
@@ -469,14 +482,14 @@ File formats:
     
     if args.nexus_directory:
         print(f"NEXUS directory: {args.nexus_directory}")
-        print(f"Found NEXUS files: {len(find_nexus_files(args.nexus_directory))}")
+        print(f"Found NEXUS files: {len(nexus_files)}")
     else:
         print(f"NEXUS files: {len(nexus_files)}")
     
     if args.ploidy_file:
         print(f"Known ploidy: {args.ploidy_file}")
     
-    success = generate_taxa_table(args)
+    success = generate_taxa_table(args, nexus_files)
     
     if success:
         print(f"\nNext steps:")
@@ -14,44 +14,104 @@ If no output file is specified, the script will create one with "_fixed" suffix.
 import re
 import sys
 import argparse
+from bisect import insort
 from collections import defaultdict
 
+# Pattern to match tip labels (alphanumeric, underscore, dash)
+# This matches labels that appear before colons or commas/parentheses
+TIP_LABEL_PATTERN = re.compile(r'([A-Za-z0-9_-]+)(?=[:),])', re.ASCII)
+
 def extract_labels_from_newick(tree_string):
     """Extract all tip labels from a Newick tree string."""
-    # Pattern to match tip labels (alphanumeric, underscore, dash)
-    # This matches labels that appear before colons or commas/parentheses
-    pattern = r'([A-Za-z0-9_-]+)(?=[:),])'
-    labels = re.findall(pattern, tree_string)
     # Remove duplicates while preserving order
-    seen = set()
-    unique_labels = []
-    for label in labels:
-        if label not in seen:
-            seen.add(label)
-            unique_labels.append(label)
-    return unique_labels
+    return list(dict.fromkeys(TIP_LABEL_PATTERN.findall(tree_string)))
+
+def find_labels_in(text, label_set, label_lengths):
+    """Return the labels from label_set that occur inside text (excluding text itself).
+
+    label_lengths is the sorted list of distinct label lengths. Each window of
+    text with one of those lengths is looked up in the set, so the cost depends
+    on len(text), not on how many labels there are.
+    """
+    found = set()
+    n = len(text)
+    for size in label_lengths:
+        if size >= n:
+            break
+        for start in range(n - size + 1):
+            window = text[start:start + size]
+            if window in label_set:
+                found.add(window)
+    return found
 
 def find_substring_problems(labels):
     """Find labels that are substrings of other labels."""
     problematic = {}  # {short_label: [longer_labels_containing_it]}
     
-    # Sort by length to check shorter labels first
-    sorted_labels = sorted(labels, key=len)
+    if not labels:
+        return problematic
     
-    for i, short_label in enumerate(sorted_labels):
-        containing_labels = []
-        for j in range(i + 1, len(sorted_labels)):
-            long_label = sorted_labels[j]
-            if short_label in long_label and short_label != long_label:
-                containing_labels.append(long_label)
-        
-        if containing_labels:
-            problematic[short_label] = containing_labels
+    # Order by length to check shorter labels first. Labels are short, so a
+    # bucket per length is cheaper than a comparison sort (and equally stable)
+    buckets = [[] for _ in range(max(map(len, labels)) + 1)]
+    for label in labels:
+        buckets[len(label)].append(label)
+    sorted_labels = [label for bucket in buckets for label in bucket]
+    
+    # Instead of testing every pair of labels, look up the windows of each
+    # label in a set of all labels
+    label_set = set(sorted_labels)
+    label_lengths = [size for size, bucket in enumerate(buckets) if bucket]
+    containing = defaultdict(list)
+    
+    for long_label in sorted_labels:
+        for short_label in find_labels_in(long_label, label_set, label_lengths):
+            containing[short_label].append(long_label)
+    
+    for short_label in sorted_labels:
+        if short_label in containing:
+            problematic[short_label] = containing[short_label]
     
     return problematic
 
-def generate_safe_replacement(original_label, existing_labels, used_replacements, suffix_style="X"):
-    """Generate a safe replacement label that won't create new substring issues."""
+def all_substrings(text):
+    """Return the set of all non-empty substrings of text."""
+    n = len(text)
+    return {text[start:end] for start in range(n) for end in range(start + 1, n + 1)}
+
+def generate_safe_replacement(original_label, existing_labels, used_replacements, suffix_style="X",
+                              label_lengths=None, containing_labels=None,
+                              replacement_set=None, replacement_lengths=None,
+                              replacement_substrings=None):
+    """Generate a safe replacement label that won't create new substring issues.
+
+    existing_labels should be a set. label_lengths (sorted distinct lengths of
+    existing_labels) can be passed in to avoid recomputing it on every call.
+    containing_labels are the existing labels that contain original_label (as
+    returned by find_substring_problems); if omitted they are found by a scan.
+    replacement_set, replacement_lengths (its sorted distinct lengths) and
+    replacement_substrings (all substrings of the replacements) describe
+    used_replacements; a caller generating many replacements should keep them
+    up to date and pass them in, otherwise they are rebuilt here.
+    """
+    if label_lengths is None:
+        label_lengths = sorted(set(len(label) for label in existing_labels))
+    
+    # Every candidate starts with original_label, so the only existing labels
+    # that can contain a candidate are the ones that already contain the original
+    if containing_labels is None:
+        containing_labels = [label for label in existing_labels
+                             if original_label in label and label != original_label]
+    
+    if replacement_set is None:
+        replacement_set = set(used_replacements.values())
+    if replacement_lengths is None:
+        replacement_lengths = sorted(set(len(r) for r in replacement_set))
+    if replacement_substrings is None:
+        replacement_substrings = set()
+        for replacement in replacement_set:
+            replacement_substrings.update(all_substrings(replacement))
+    
     # Different suffix styles to avoid problematic characters
     if suffix_style == "X":
         base_replacement = f"{original_label}X"
@@ -74,18 +134,22 @@ def generate_safe_replacement(original_label, existing_labels, used_replacements
                 candidate = f"{base_replacement}{counter}"
         
         # Check if this candidate would create new problems
-        is_safe = True
-        for existing in existing_labels:
-            if existing != original_label:  # Don't compare with the original
-                if candidate in existing or existing in candidate:
+        # (don't compare with the original, which the candidate always contains)
+        contained = find_labels_in(candidate, existing_labels, label_lengths)
+        contained.discard(original_label)
+        is_safe = not contained and candidate not in existing_labels
+        
+        if is_safe:
+            for existing in containing_labels:
+                if candidate in existing:
                     is_safe = False
                     break
         
-        # Check against other replacements we've made
-        for replacement in used_replacements.values():
-            if candidate in replacement or replacement in candidate:
-                is_safe = False
-                break
+        # Check against other replacements we've made: the candidate must not
+        # be part of one of them, nor contain one
+        if is_safe and (candidate in replacement_substrings
+                        or find_labels_in(candidate, replacement_set, replacement_lengths)):
+            is_safe = False
         
         if is_safe:
             return candidate
@@ -94,22 +158,47 @@ def generate_safe_replacement(original_label, existing_labels, used_replacements
         if counter > 1000:  # Safety valve
             raise Exception(f"Could not generate safe replacement for {original_label}")
 
-def fix_tree_labels(tree_string, label_replacements):
-    """Apply label replacements to a tree string."""
-    fixed_tree = tree_string
+def build_replacement_pattern(originals):
+    """Compile one alternation regex matching any of the given labels."""
+    # Sort by length (longest first) so the alternation prefers the longest
+    # label at each position
+    sorted_originals = sorted(originals, key=len, reverse=True)
     
-    # Sort replacements by length of original label (longest first)
-    # to avoid partial replacements
-    sorted_replacements = sorted(label_replacements.items(), 
-                               key=lambda x: len(x[0]), reverse=True)
+    # Use word boundaries to ensure we're replacing complete labels
+    # Pattern matches any of the labels when followed by : or ) or ,
+    return re.compile(
+        r'\b(' + '|'.join(re.escape(original) for original in sorted_originals) + r')(?=[:),])'
+    )
+
+def fix_tree_labels(tree_string, label_replacements, pattern=None):
+    """Apply label replacements to a tree string.
+
+    pattern is build_replacement_pattern(label_replacements); pass it in when
+    fixing many trees so it is compiled only once.
+    """
+    if not label_replacements:
+        return tree_string
     
-    for original, replacement in sorted_replacements:
-        # Use word boundaries to ensure we're replacing complete labels
-        # Pattern matches the label when it's followed by : or ) or ,
-        pattern = f'\\b{re.escape(original)}(?=[:),])'
-        fixed_tree = re.sub(pattern, replacement, fixed_tree)
+    if pattern is None:
+        pattern = build_replacement_pattern(label_replacements)
     
-    return fixed_tree
+    # Single pass over the tree, looking up each matched label's replacement
+    return pattern.sub(lambda m: label_replacements[m.group(1)], tree_string)
+
+def collect_tree_labels(input_file):
+    """Read a Newick file line by line and collect its tip labels.
+
+    Returns (number of trees, set of unique labels).
+    """
+    num_trees = 0
+    all_labels = set()
+    with open(input_file, 'r') as f:
+        for line in f:
+            tree = line.strip()
+            if tree:
+                num_trees += 1
+                all_labels.update(extract_labels_from_newick(tree))
+    return num_trees, all_labels
 
 def process_newick_file(input_file, output_file=None, suffix_style="X"):
     """Process a Newick file and fix substring label issues."""
@@ -122,9 +211,9 @@ def process_newick_file(input_file, output_file=None, suffix_style="X"):
     
     print(f"Reading trees from: {input_file}")
     
+    # First pass: only collect labels, trees are not kept in memory
     try:
-        with open(input_file, 'r') as f:
-            content = f.read()
+        num_trees, all_labels = collect_tree_labels(input_file)
     except FileNotFoundError:
         print(f"Error: Could not find file {input_file}")
         return False
@@ -132,21 +221,11 @@ def process_newick_file(input_file, output_file=None, suffix_style="X"):
         print(f"Error reading file {input_file}: {e}")
         return False
     
-    # Split into individual trees (each line should be a tree)
-    trees = [line.strip() for line in content.strip().split('\n') if line.strip()]
-    
-    if not trees:
+    if not num_trees:
         print("No trees found in file")
         return False
     
-    print(f"Found {len(trees)} tree(s)")
-    
-    # Collect all labels from all trees
-    all_labels = set()
-    for tree in trees:
-        labels = extract_labels_from_newick(tree)
-        all_labels.update(labels)
-    
+    print(f"Found {num_trees} tree(s)")
     print(f"Found {len(all_labels)} unique tip labels")
     
     # Find substring problems
@@ -164,29 +243,40 @@ def process_newick_file(input_file, output_file=None, suffix_style="X"):
     # Generate replacements
     label_replacements = {}
     used_replacements = {}
+    label_lengths = sorted(set(len(label) for label in all_labels))
+    # Kept up to date here rather than rebuilt from used_replacements per call
+    replacement_set = set()
+    replacement_lengths = []
+    replacement_substrings = set()
     
     for problematic_label in problematic.keys():
         safe_replacement = generate_safe_replacement(
-            problematic_label, all_labels, used_replacements, suffix_style
+            problematic_label, all_labels, used_replacements, suffix_style, label_lengths,
+            problematic[problematic_label], replacement_set, replacement_lengths,
+            replacement_substrings
         )
         label_replacements[problematic_label] = safe_replacement
         used_replacements[problematic_label] = safe_replacement
+        replacement_set.add(safe_replacement)
+        if len(safe_replacement) not in replacement_lengths:
+            insort(replacement_lengths, len(safe_replacement))
+        replacement_substrings.update(all_substrings(safe_replacement))
     
     print(f"\nProposed replacements:")
     for original, replacement in label_replacements.items():
         print(f"  '{original}' -> '{replacement}'")
     
-    # Apply fixes to all trees
-    fixed_trees = []
-    for tree in trees:
-        fixed_tree = fix_tree_labels(tree, label_replacements)
-        fixed_trees.append(fixed_tree)
+    # The replacements are fixed from here on, so compile their pattern once
+    pattern = build_replacement_pattern(label_replacements)
     
-    # Write fixed trees
+    # Second pass: stream trees from the input, writing each fixed tree
+    # as it is read (each line should be a tree)
     try:
-        with open(output_file, 'w') as f:
-            for tree in fixed_trees:
-                f.write(tree + '\n')
+        with open(input_file, 'r') as fin, open(output_file, 'w') as fout:
+            for line in fin:
+                tree = line.strip()
+                if tree:
+                    fout.write(fix_tree_labels(tree, label_replacements, pattern) + '\n')
         print(f"\nFixed trees written to: {output_file}")
         print("You can now use this file with GRAMPA!")
         return True
@@ -218,18 +308,11 @@ Examples:
     if args.dry_run:
         # Just check for problems
         try:
-            with open(args.input_file, 'r') as f:
-                content = f.read()
+            _, all_labels = collect_tree_labels(args.input_file)
         except FileNotFoundError:
             print(f"Error: Could not find file {args.input_file}")
             return 1
         
-        trees = [line.strip() for line in content.strip().split('\n') if line.strip()]
-        all_labels = set()
-        for tree in trees:
-            labels = extract_labels_from_newick(tree)
-            all_labels.update(labels)
-        
         problematic = find_substring_problems(list(all_labels))
         
         if problematic:
@@ -10,30 +10,64 @@ python "/groups/itay_mayrose/tomulanovski/gene2net/scripts/grampa_to_polyphest_r
 import sys
 import re
 
+# Regular expression to find node names with underscores
+# This pattern matches anything that's not a parenthesis, comma, colon, or semicolon
+# followed by an underscore and then captures the part after the underscore
+# Newick is plain ASCII, so trees are handled as bytes end-to-end (no decode/encode)
+NODE_NAME_PATTERN = re.compile(rb'([^(),;:]+)_([^(),;:]+)(?=[:;,)]|$)')
+
 def rename_nodes_in_tree(tree_string):
     """
     Rename all nodes in a Newick tree string to use only the text after the underscore.
     
     Args:
-        tree_string (str): Newick-formatted tree string
+        tree_string (bytes): Newick-formatted tree string
     
     Returns:
-        str: Modified tree string with renamed nodes
+        bytes: Modified tree string with renamed nodes
     """
-    # Regular expression to find node names with underscores
-    # This pattern matches anything that's not a parenthesis, comma, colon, or semicolon
-    # followed by an underscore and then captures the part after the underscore
-    pattern = r'([^(),;:]+)_([^(),;:]+)(?=[:;,)]|$)'
-    
     # Replace each match with just the part after the underscore
-    renamed_tree = re.sub(pattern, r'\2', tree_string)
+    return NODE_NAME_PATTERN.sub(rb'\2', tree_string)
+
+def iter_trees(f_in, chunk_size=65536):
+    """
+    Yield the trees in an open Newick file one at a time, without reading
+    the whole file into memory.
+    Trees are split on semicolons; each yielded tree is stripped and has its
+    semicolon added back. Empty pieces are skipped.
+    
+    Args:
+        f_in: Open binary file handle
+        chunk_size (int): Number of bytes to read at a time
     
-    return renamed_tree
+    Yields:
+        bytes: One Newick tree string ending with ';'
+    """
+    # Bytes read since the last semicolon, joined only once one arrives (so a
+    # tree spanning many chunks is not re-copied and re-split per chunk)
+    pending = []
+    for chunk in iter(lambda: f_in.read(chunk_size), b''):
+        pieces = chunk.split(b';')
+        if len(pieces) == 1:
+            pending.append(chunk)
+            continue
+        pending.append(pieces[0])
+        pieces[0] = b''.join(pending)
+        # The last piece has no semicolon yet, keep it for the next chunk
+        pending = [pieces.pop()]
+        for piece in pieces:
+            piece = piece.strip()
+            if piece:
+                yield piece + b';'
+    buffer = b''.join(pending).strip()
+    if buffer:
+        yield buffer + b';'
 
 def process_tree_file(input_file, output_file):
     """
     Process all trees in the input file and write renamed trees to the output file.
-    Trees are identified by semicolon (;) endings, as per Newick format.
+    Trees are identified by semicolon (;) endings, as per Newick format, and are
+    streamed one at a time from input to output.
     
     Args:
         input_file (str): Path to the input file containing Newick trees
@@ -43,23 +77,13 @@ def process_tree_file(input_file, output_file):
         int: Number of trees processed
     """
     try:
-        with open(input_file, 'r') as f_in:
-            content = f_in.read()
-        
-        # Split the content by semicolons to separate trees
-        # We add the semicolon back to each tree after splitting
-        tree_strings = [t.strip() + ';' for t in content.split(';') if t.strip()]
-        
-        processed_trees = []
-        for tree_string in tree_strings:
-            renamed_tree = rename_nodes_in_tree(tree_string)
-            processed_trees.append(renamed_tree)
-        
-        with open(output_file, 'w') as f_out:
-            for tree in processed_trees:
-                f_out.write(tree + '\n')
+        num_trees = 0
+        with open(input_file, 'rb') as f_in, open(output_file, 'wb') as f_out:
+            for tree_string in iter_trees(f_in):
+                f_out.write(rename_nodes_in_tree(tree_string) + b'\n')
+                num_trees += 1
         
-        return len(processed_trees)
+        return num_trees
     
     except Exception as e:
         print(f"Error processing trees: {str(e)}")
@@ -2,12 +2,37 @@
 Check if a phylogenetic tree is rooted.
 Usage: python "/groups/itay_mayrose/tomulanovski/gene2net/scripts/is_rooted.py" "newick_string"
    or: python "/groups/itay_mayrose/tomulanovski/gene2net/scripts/is_rooted.py" tree_file
+   or: ls *.tre | python "/groups/itay_mayrose/tomulanovski/gene2net/scripts/is_rooted.py" -
 Returns: True if rooted, False if unrooted
+With "-", reads one tree file (or Newick string) per line from stdin and prints
+one result per line, so a single process checks many trees.
 """
 import sys
 import os
+import re
 from ete3 import Tree
 
+# Label written right after a closing parenthesis (internal node name or support)
+INTERNAL_LABEL_PATTERN = re.compile(r'\)\s*([^\s:,();\[]+)')
+
+# How much of a tree file to inspect when guessing its format
+FORMAT_SNIFF_SIZE = 4096
+
+def order_formats(newick_head, formats):
+    """Order the ete3 formats to try so the likely one comes first.
+    
+    Format 0 reads internal labels as support values, so it fails on trees
+    with named internal nodes; format 1 reads them as names. Only the order
+    of attempts changes, every format is still tried if needed.
+    """
+    for label in INTERNAL_LABEL_PATTERN.findall(newick_head):
+        try:
+            float(label)
+        except ValueError:
+            # Named internal nodes
+            return sorted(formats, key=lambda fmt: fmt != 1)
+    return list(formats)
+
 def is_rooted(tree_input):
     """Check if tree is rooted (root has 2 children, not >2)."""
     tree = None
@@ -15,8 +40,10 @@ def is_rooted(tree_input):
     # Try to determine if input is file or string
     if os.path.isfile(tree_input):
         try:
+            with open(tree_input, 'r') as f:
+                head = f.read(FORMAT_SNIFF_SIZE)
             # Try common Newick formats
-            for fmt in [0, 1, 2, 5]:  # Most common formats
+            for fmt in order_formats(head, [0, 1, 2, 5]):  # Most common formats
                 try:
                     tree = Tree(tree_input, format=fmt)
                     break
@@ -30,7 +57,7 @@ def is_rooted(tree_input):
         # Treat as Newick string
         try:
             # Try common formats for string input
-            for fmt in [0, 1]:
+            for fmt in order_formats(tree_input[:FORMAT_SNIFF_SIZE], [0, 1]):
                 try:
                     tree = Tree(tree_input, format=fmt)
                     break
@@ -48,14 +75,36 @@ def is_rooted(tree_input):
     # Unrooted tree: typically 3 or more children at root
     return n_children == 2
 
+def check_batch(lines):
+    """Print True/False for each tree in lines ("Error" if it could not be read).
+    
+    Returns the number of trees that could not be read.
+    """
+    n_errors = 0
+    for line in lines:
+        tree_input = line.strip()
+        if not tree_input:
+            continue
+        try:
+            print("True" if is_rooted(tree_input) else "False")
+        except Exception as e:
+            print("Error")
+            print(f"Error: {tree_input}: {e}", file=sys.stderr)
+            n_errors += 1
+    return n_errors
+
 def main():
     if len(sys.argv) != 2:
         print('Usage: python is_rooted.py "newick_string"')
         print('   or: python is_rooted.py tree_file')
+        print('   or: python is_rooted.py -    (one tree per line on stdin)')
         sys.exit(1)
     
     tree_input = sys.argv[1]
     
+    if tree_input == '-':
+        sys.exit(1 if check_batch(sys.stdin) else 0)
+    
     try:
         result = is_rooted(tree_input)
         print("True" if result else "False")
@@ -2,20 +2,26 @@
 
 from ete3 import Tree
 import re
-from itertools import combinations
+from collections import defaultdict
+from functools import lru_cache
 
 tree = Tree("/groups/itay_mayrose/tomulanovski/gene2net/papers/Lawrence_2016/gene_trees/reduced_nia.tre")
 
+# Taxon name patterns: genus_species_ID_letter, and genus_species_modifier_ID_letter
+SPECIES_ID_PATTERN = re.compile(r'(\w+)_(\w+)_([^_]+)_\w+')
+MODIFIED_SPECIES_ID_PATTERN = re.compile(r'(\w+)_(\w+)_(\w+)_([^_]+)_\w+')
+
+@lru_cache(maxsize=None)
 def extract_species_id(name):
     """Extract species and ID from taxon name"""
     # The pattern is genus_species_ID_letter
-    match = re.match(r'(\w+)_(\w+)_([^_]+)_\w+', name)
+    match = SPECIES_ID_PATTERN.match(name)
     if match:
         genus, species, identifier = match.groups()
         return f"{genus}_{species}_{identifier}"
     
     # Handle special cases like 4x in the identifier
-    match = re.match(r'(\w+)_(\w+)_(\w+)_([^_]+)_\w+', name)
+    match = MODIFIED_SPECIES_ID_PATTERN.match(name)
     if match:
         genus, species, modifier, identifier = match.groups()
         return f"{genus}_{species}_{modifier}_{identifier}"
@@ -37,24 +43,46 @@ def get_taxa_by_species_id():
         
     return taxa_by_species_id
 
-def is_monophyletic(tree, taxa):
-    """Check if a set of taxa forms a monophyletic group"""
-    if len(taxa) <= 1:
-        return False  # Single taxon can't form a monophyletic group for reduction
-        
-    # Get the most recent common ancestor
-    mrca = tree.get_common_ancestor(taxa)
+def get_single_species_clades():
+    """Find every clade whose leaves all share one species+ID.
     
-    # Get all leaves under the MRCA
-    mrca_leaves = set(mrca.get_leaves())
-    taxa_set = set(taxa)
+    A set of taxa is monophyletic exactly when it is the full leaf set of some
+    node, so one postorder pass finds all candidate groups.
+    Returns {species_id: {leaf indices (sorted tuple): leaves in tree order}};
+    leaf indices are positions in tree.get_leaves().
+    """
+    leaf_index = {leaf: i for i, leaf in enumerate(tree.get_leaves())}
+    clades_by_species_id = defaultdict(dict)
     
-    # If all leaves under MRCA are in our taxa list, it's monophyletic
-    return mrca_leaves.issubset(taxa_set) or mrca_leaves == taxa_set
+    # Species ID and leaves under each node, or None once the leaves are mixed
+    node_species = {}
+    node_leaves = {}
+    
+    for node in tree.traverse("postorder"):
+        if node.is_leaf():
+            node_species[node] = extract_species_id(node.name)
+            node_leaves[node] = [node]
+            continue
+        
+        child_species = {node_species[child] for child in node.children}
+        if len(child_species) != 1 or None in child_species:
+            node_species[node] = node_leaves[node] = None
+            continue
+        
+        species_id = child_species.pop()
+        leaves = sorted((leaf for child in node.children for leaf in node_leaves[child]),
+                        key=leaf_index.__getitem__)
+        node_species[node] = species_id
+        node_leaves[node] = leaves
+        if len(leaves) > 1:
+            clades_by_species_id[species_id][tuple(leaf_index[leaf] for leaf in leaves)] = leaves
+    
+    return clades_by_species_id
 
 def find_all_monophyletic_subgroups():
     """Find all monophyletic subgroups for each species group"""
     taxa_by_species_id = get_taxa_by_species_id()
+    clades_by_species_id = get_single_species_clades()
     monophyletic_groups = []
     
     for species_id, taxa_list in taxa_by_species_id.items():
@@ -62,31 +90,28 @@ def find_all_monophyletic_subgroups():
         if len(taxa_list) <= 1:
             continue
         
-        # Try all possible subgroups, starting from the largest
-        for size in range(len(taxa_list), 1, -1):
-            for subset in combinations(taxa_list, size):
-                if is_monophyletic(tree, subset):
-                    # Convert to list for easier handling
-                    subset_list = list(subset)
-                    monophyletic_groups.append((species_id, subset_list))
-                    
-                    # Remove these taxa from further consideration
-                    for taxon in subset_list:
-                        if taxon in taxa_list:
-                            taxa_list.remove(taxon)
-                    
-                    # Break the size loop and move on to the next set of remaining taxa
-                    break
+        # Try the subgroups starting from the largest; at each size take the
+        # first one (in tree order) whose taxa have not been used yet, and
+        # only one group per size
+        candidates = sorted(clades_by_species_id.get(species_id, {}).items(),
+                            key=lambda item: (-len(item[0]), item[0]))
+        used = set()
+        last_size = None
+        
+        for indices, subset_list in candidates:
+            if len(indices) == last_size or not used.isdisjoint(indices):
+                continue
+            monophyletic_groups.append((species_id, subset_list))
+            
+            # Remove these taxa from further consideration
+            used.update(indices)
+            last_size = len(indices)
         
     return monophyletic_groups
 
 def reduce_tree_based_on_monophyletic_groups(monophyletic_groups):
-    """Create a reduced tree keeping only one representative from each monophyletic group"""
-    nodes_to_keep = set()
-    
-    # Add all leaves to nodes_to_keep initially
-    for leaf in tree.get_leaves():
-        nodes_to_keep.add(leaf.name)
+    """Reduce the tree in place, keeping only one representative from each monophyletic group"""
+    leaves_to_remove = set()
     
     # For each monophyletic group, keep only one representative
     removed_nodes = []
@@ -97,19 +122,29 @@ def reduce_tree_based_on_monophyletic_groups(monophyletic_groups):
         kept_node = taxa_list[0].name
         to_remove = [taxon.name for taxon in taxa_list[1:]]
         
-        # Update the set of nodes to keep
-        for node_name in to_remove:
-            if node_name in nodes_to_keep:
-                nodes_to_keep.remove(node_name)
-                removed_nodes.append(node_name)
+        for taxon in taxa_list[1:]:
+            if taxon not in leaves_to_remove:
+                leaves_to_remove.add(taxon)
+                removed_nodes.append(taxon.name)
         
         monophyletic_reductions.append((species_id, kept_node, to_remove))
     
-    # Create a pruned tree with only the nodes to keep
-    pruned_tree = tree.copy()
-    pruned_tree.prune(list(nodes_to_keep), preserve_branch_length=True)
+    # We already know exactly which leaves go, so remove them directly instead
+    # of copying the tree and pruning to the kept set. Then, in one postorder
+    # pass, drop clades left empty and collapse single-child nodes into their
+    # child (adding the branch lengths), as prune(preserve_branch_length=True)
+    # does. The root is always kept.
+    original_leaves = set(tree.get_leaves())
+    for node in list(tree.traverse("postorder")):
+        if node is tree:
+            continue
+        if node in leaves_to_remove or (not node.children and node not in original_leaves):
+            node.detach()
+        elif len(node.children) == 1:
+            node.children[0].dist += node.dist
+            node.delete(prevent_nondicotomic=False)
     
-    return pruned_tree, monophyletic_reductions, removed_nodes
+    return tree, monophyletic_reductions, removed_nodes
 
 # Find all monophyletic groups
 monophyletic_groups = find_all_monophyletic_subgroups()
@@ -5,14 +5,23 @@ This script starts from each leaf and checks if it's part of a monophyletic grou
 or a polytomy that should be reduced, with special handling for names ending in 'a' or 'b'.
 """
 
+import re
 import dendropy
-import itertools
 from collections import defaultdict
+from functools import lru_cache
 
+# Genus and species (the first two words) and the rest of a taxon label
+LABEL_PATTERN = re.compile(r'\s*(\S+)\s+(\S+)(.*)', re.DOTALL)
+
+# A subspecies or variety designation ("subsp X" / "var X") within a label
+VARIANT_PATTERN = re.compile(r'(?<!\S)(subsp|var)\s+(\S+)')
+
+@lru_cache(maxsize=None)
 def parse_taxon_name(taxon_label):
     """
     Parse taxon label with space separators
     Returns (species, variant_type, variant_name, full_name)
+    Results are cached per label (so a parse warning is printed once per label).
     """
     parts = taxon_label.split()
     if len(parts) < 2:
@@ -42,36 +51,24 @@ def parse_taxon_name(taxon_label):
     
     return base_species, variant_type, variant_name, taxon_label
 
-def clean_taxon_labels(tree):
+def clean_taxon_labels(leaves):
     """
-    Clean taxon labels by removing accession numbers.
+    Clean the taxon labels of the given leaves by removing accession numbers.
     Leaves only genus, species, and variant information.
     """
-    for leaf in tree.leaf_node_iter():
-        label = leaf.taxon.label
-        parts = label.split()
-        
-        if len(parts) < 2:
+    for leaf in leaves:
+        match = LABEL_PATTERN.match(leaf.taxon.label)
+        if not match:
             continue  # Skip if can't parse properly
-            
-        genus = parts[0]
-        species = parts[1]
-        clean_label = f"{genus} {species}"
+        
+        genus, species, rest = match.groups()
         
         # Add subspecies or variety if present
-        i = 2
-        while i < len(parts):
-            if parts[i] == 'subsp' and i + 1 < len(parts):
-                clean_label += f" subsp {parts[i+1]}"
-                i += 2
-            elif parts[i] == 'var' and i + 1 < len(parts):
-                clean_label += f" var {parts[i+1]}"
-                i += 2
-            else:
-                i += 1
+        variants = ''.join(f" {var_type} {var_name}"
+                           for var_type, var_name in VARIANT_PATTERN.findall(rest))
         
         # Update the taxon label
-        leaf.taxon.label = clean_label
+        leaf.taxon.label = f"{genus} {species}{variants}"
 
 def get_variant_key(leaf):
     """Get a key representing the species+variant of a leaf"""
@@ -80,14 +77,28 @@ def get_variant_key(leaf):
         return f"{species} {var_type} {var_name}"
     return species
 
-def is_monophyletic(tree, taxa_subset):
-    """Check if a subset of taxa forms a monophyletic group"""
-    if len(taxa_subset) <= 1:
-        return True
-        
-    subset_mrca = tree.mrca(taxa=taxa_subset)
-    subset_descendants = set(leaf.taxon for leaf in subset_mrca.leaf_nodes())
-    return set(taxa_subset) == subset_descendants
+def annotate_clades(tree, leaf_variant_keys):
+    """
+    In one postorder pass, map every node to the variant key shared by all
+    leaves below it (None if its leaves have different variants), and every
+    internal node to {variant key: [leaf children with that key]}, with the
+    leaves in child order. leaf_variant_keys is indexed by leaf._idx.
+    """
+    clade_variant_keys = {}
+    sibling_variant_groups = {}
+    for node in tree.postorder_node_iter():
+        if node.is_leaf():
+            clade_variant_keys[node] = leaf_variant_keys[node._idx]
+            continue
+        keys = set()
+        groups = defaultdict(list)
+        for child in node.child_node_iter():
+            keys.add(clade_variant_keys[child])
+            if child.is_leaf():
+                groups[clade_variant_keys[child]].append(child)
+        clade_variant_keys[node] = keys.pop() if len(keys) == 1 else None
+        sibling_variant_groups[node] = groups
+    return clade_variant_keys, sibling_variant_groups
 
 def ends_with_a_or_b(taxon_label):
     """Check if a taxon label ends with 'a' or 'b'"""
@@ -128,37 +139,60 @@ def reduce_tree(input_path, output_path, clean_labels=True, verbose=True):
     # Read the tree
     print(f"Reading tree from {input_path}")
     tree = dendropy.Tree.get(path=input_path, schema="newick")
-    original_taxa_count = len(tree.leaf_nodes())
+    all_leaves = list(tree.leaf_node_iter())
+    original_taxa_count = len(all_leaves)
     
     print(f"Original tree has {original_taxa_count} taxa")
     
     # Group all leaves by variant key (species + variant)
     variant_groups = defaultdict(list)
-    all_leaves = list(tree.leaf_node_iter())
+    leaf_variant_keys = []  # indexed by leaf._idx
     
-    for leaf in all_leaves:
+    for idx, leaf in enumerate(all_leaves):
+        leaf._idx = idx  # position in all_leaves, indexes the flag arrays below
         variant_key = get_variant_key(leaf)
         variant_groups[variant_key].append(leaf)
+        leaf_variant_keys.append(variant_key)
     
     # Report variant grouping
     print(f"\nFound {len(variant_groups)} distinct species/variant combinations")
-    for variant, leaves in variant_groups.items():
-        if len(leaves) > 1:
-            print(f"  {variant}: {len(leaves)} accessions")
+    if verbose:
+        duplicated = [f"  {variant}: {len(leaves)} accessions"
+                      for variant, leaves in variant_groups.items() if len(leaves) > 1]
+        if duplicated:
+            print("\n".join(duplicated))
+    
+    # Bipartitions are encoded once, with DendroPy's defaults (this suppresses
+    # unifurcations and collapses an unrooted basal bifurcation, as the first
+    # tree.mrca() call used to), before the clades are annotated. Each node's
+    # edge.bipartition.leafset_bitmask then identifies the leaves below it
+    if any(len(leaves) > 1 for leaves in variant_groups.values()):
+        tree.encode_bipartitions()
+    clade_variant_keys, sibling_variant_groups = annotate_clades(tree, leaf_variant_keys)
     
     # Nodes to remove
-    nodes_to_remove = set()
-    processed_leaves = set()
+    # (a leaf's flags in processed/removed are at its _idx; byte indexing is
+    # cheaper than hashing Node objects into sets)
+    nodes_to_remove = []
+    processed = bytearray(original_taxa_count)
+    removed = bytearray(original_taxa_count)
+    
+    def mark_removed(nodes):
+        for node in nodes:
+            if not removed[node._idx]:
+                removed[node._idx] = 1
+                nodes_to_remove.append(node)
+    
     
     print("\n==== ANALYZING INDIVIDUAL LEAVES ====\n")
     
     # Iterate through all leaves
     for leaf in all_leaves:
         # Skip if already processed
-        if leaf in processed_leaves or leaf in nodes_to_remove:
+        if processed[leaf._idx] or removed[leaf._idx]:
             continue
             
-        variant_key = get_variant_key(leaf)
+        variant_key = leaf_variant_keys[leaf._idx]
         same_variant_leaves = variant_groups[variant_key]
         
         # Skip if this is the only leaf with this variant
@@ -167,56 +201,51 @@ def reduce_tree(input_path, output_path, clean_labels=True, verbose=True):
                 print(f"Leaf '{leaf.taxon.label}' is the only one with variant '{variant_key}' - keeping it")
             continue
         
-        # Check if leaf is part of a monophyletic group
-        found_monophyletic_group = False
+        # Skip leaves already being processed
+        valid_leaves = [l for l in same_variant_leaves if not (processed[l._idx] or removed[l._idx])]
+        valid_mask = 0
+        for l in valid_leaves:
+            valid_mask |= l.edge.bipartition.leafset_bitmask
         
-        # Try to find largest monophyletic group containing this leaf
-        for size in range(len(same_variant_leaves), 1, -1):
-            if found_monophyletic_group:
+        # A monophyletic group containing this leaf is the leaf set of one of
+        # its ancestors. The largest one is the highest ancestor whose leaves
+        # all have this variant and are still valid; walk up to find it
+        # (leaf sets are compared as the encoded bipartition bitmasks)
+        group_mask = None
+        node = leaf.parent_node
+        while node is not None and clade_variant_keys[node] == variant_key:
+            clade_mask = node.edge.bipartition.leafset_bitmask
+            if clade_mask & ~valid_mask:
                 break
-                
-            # Skip combinations already being processed
-            valid_leaves = [l for l in same_variant_leaves if l not in processed_leaves and l not in nodes_to_remove]
-            if len(valid_leaves) < size:
-                continue
-                
-            # Generate combinations containing our leaf
-            for subset in itertools.combinations(valid_leaves, size):
-                if leaf not in subset:
-                    continue
-                    
-                subset_taxa = [node.taxon for node in subset]
-                if is_monophyletic(tree, subset_taxa):
-                    # Found monophyletic group!
-                    found_monophyletic_group = True
-                    
-                    # Select which nodes to remove considering 'a'/'b' rule
-                    to_remove = select_nodes_to_remove(subset, leaf, verbose)
-                    
-                    if verbose:
-                        print(f"Leaf '{leaf.taxon.label}' is part of monophyletic group of size {size}")
-                        print(f"  Keeping: {leaf.taxon.label}")
-                        if to_remove:
-                            print(f"  Removing: {[node.taxon.label for node in to_remove]}")
-                        else:
-                            print(f"  No nodes to remove due to special rule")
-                    
-                    nodes_to_remove.update(to_remove)
-                    processed_leaves.update(subset)
-                    break
+            group_mask = clade_mask
+            node = node.parent_node
         
-        if found_monophyletic_group:
+        if group_mask is not None:
+            # Found monophyletic group! (members kept in tree order)
+            subset = [l for l in valid_leaves if l.edge.bipartition.leafset_bitmask & group_mask]
+            
+            # Select which nodes to remove considering 'a'/'b' rule
+            to_remove = select_nodes_to_remove(subset, leaf, verbose)
+            
+            if verbose:
+                print(f"Leaf '{leaf.taxon.label}' is part of monophyletic group of size {len(subset)}")
+                print(f"  Keeping: {leaf.taxon.label}")
+                if to_remove:
+                    print(f"  Removing: {[node.taxon.label for node in to_remove]}")
+                else:
+                    print(f"  No nodes to remove due to special rule")
+            
+            mark_removed(to_remove)
+            for l in subset:
+                processed[l._idx] = 1
             continue
             
         # Check if leaf is part of a polytomy
         parent = leaf.parent_node
         if parent:
-            # Get direct children of parent that are leaves
-            sibling_leaves = [child for child in parent.child_nodes() if child.is_leaf()]
-            
-            # Check if any siblings have same variant
-            same_variant_siblings = [sib for sib in sibling_leaves 
-                                   if sib != leaf and get_variant_key(sib) == variant_key]
+            # Direct leaf children of parent with the same variant (precomputed)
+            same_variant_siblings = [sib for sib in sibling_variant_groups[parent][variant_key]
+                                   if sib != leaf]
             
             if same_variant_siblings:
                 # Found polytomy with same variant!
@@ -236,9 +265,10 @@ def reduce_tree(input_path, output_path, clean_labels=True, verbose=True):
                     else:
                         print(f"  No nodes to remove due to special rule")
                 
-                nodes_to_remove.update(to_remove)
-                processed_leaves.add(leaf)
-                processed_leaves.update(same_variant_siblings)
+                mark_removed(to_remove)
+                processed[leaf._idx] = 1
+                for sib in same_variant_siblings:
+                    processed[sib._idx] = 1
     
     # Summarize and remove nodes
     removal_count = len(nodes_to_remove)
@@ -250,7 +280,8 @@ def reduce_tree(input_path, output_path, clean_labels=True, verbose=True):
         # Clean taxon labels if requested
         if clean_labels:
             print("\n==== CLEANING TAXON LABELS ====")
-            clean_taxon_labels(tree)
+            # The tree is unchanged, so the leaf list from above can be reused
+            clean_taxon_labels(all_leaves)
             print("Removed accession numbers from taxon labels")
             
         tree.write(path=output_path, schema="newick")
@@ -262,15 +293,17 @@ def reduce_tree(input_path, output_path, clean_labels=True, verbose=True):
     print(f"\n==== REMOVING {removal_count} NODES ====")
     taxa_to_prune = [node.taxon for node in nodes_to_remove]
     
-    for node in nodes_to_remove:
-        print(f"Removing: {node.taxon.label}")
+    if verbose:
+        # One write for the whole list instead of a print per node
+        print("\n".join(f"Removing: {node.taxon.label}" for node in nodes_to_remove))
     
     tree.prune_taxa(taxa_to_prune)
     
-    # Clean taxon labels if requested
+    # Clean taxon labels if requested (the surviving leaves are known from
+    # the removal flags, so the pruned tree does not need another traversal)
     if clean_labels:
         print("\n==== CLEANING TAXON LABELS ====")
-        clean_taxon_labels(tree)
+        clean_taxon_labels(leaf for leaf in all_leaves if not removed[leaf._idx])
         print("Removed accession numbers from taxon labels")
     
     # Write the reduced tree
@@ -11,70 +11,46 @@ import sys
 import argparse
 import re
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 
-def parse_newick_leaves(newick_string):
-    """Extract all leaf names from a Newick string using regex."""
-    # This regex finds leaf names that are proper identifiers
-    # Must start with a letter and can contain letters, numbers, underscores
-    pattern = r'([a-zA-Z][a-zA-Z0-9_]*)'
-    
-    # Find all potential leaf names
-    matches = re.findall(pattern, newick_string)
-    
-    # Filter out obvious non-leaf elements
-    leaves = []
-    for match in matches:
-        # Skip common internal node indicators and very short names
-        if match in ['internal', 'node'] or len(match) < 2:
-            continue
-        leaves.append(match)
-    
-    return leaves
+# A leaf name: an identifier (starts with a letter; letters, numbers,
+# underscores) at the start of the tree or right after '(' or ',', and
+# directly followed by ':', ',', ')', ';' or the end of the tree
+LEAF_NAME_PATTERN = re.compile(r'(?:(?<=[(,])|^)([a-zA-Z][a-zA-Z0-9_]*)(?=[,:);]|\Z)')
 
-def replace_leaf_names_in_order(newick_string, leaves):
-    """Replace leaf names in the order they appear, adding copy numbers."""
-    species_counts = defaultdict(int)
-    result = ""
-    i = 0
-    
-    while i < len(newick_string):
-        # Check if we're at the start of a potential leaf name
-        found_leaf = False
-        
-        # Try to match the longest possible leaf name first
-        for leaf in sorted(set(leaves), key=len, reverse=True):
-            if newick_string[i:].startswith(leaf):
-                # Check if this is a complete word boundary
-                # Before: should be (, or start of string
-                before_ok = i == 0 or newick_string[i-1] in "(,"
-                # After: should be :, ,, ), ; or end of string
-                after_ok = (i + len(leaf) >= len(newick_string) or 
-                           newick_string[i + len(leaf)] in ",:);")
-                
-                if before_ok and after_ok:
-                    species_counts[leaf] += 1
-                    copy_number = species_counts[leaf]
-                    new_name = f"{copy_number}_{leaf}"
-                    result += new_name
-                    i += len(leaf)
-                    found_leaf = True
-                    break
-        
-        if not found_leaf:
-            result += newick_string[i]
-            i += 1
-    
-    return result
+# Identifiers that are never treated as leaf names
+NON_LEAF_NAMES = {'internal', 'node'}
+
+# Number of lines read and handed to the worker pool at a time (executor.map
+# submits all of its input at once, so the file is fed to it in batches)
+BATCH_SIZE = 4096
 
 def reformat_tree(newick_string):
-    """Reformat a single tree by adding copy numbers to duplicate species."""
-    # Extract all leaf names
-    leaves = parse_newick_leaves(newick_string)
+    """Reformat a single tree by adding copy numbers to duplicate species.
     
-    # Replace leaf names in order they appear
-    result = replace_leaf_names_in_order(newick_string, leaves)
+    Leaf names are numbered in the order they appear (first copy is 1_name,
+    second is 2_name, ...). Single-character names are left unchanged.
+    """
+    species_counts = defaultdict(int)
+    
+    def number_leaf(match):
+        leaf = match.group(1)
+        # Skip common internal node indicators and very short names
+        if leaf in NON_LEAF_NAMES or len(leaf) < 2:
+            return leaf
+        species_counts[leaf] += 1
+        return f"{species_counts[leaf]}_{leaf}"
     
-    return result
+    # Single regex pass, numbering each leaf as it is matched
+    return LEAF_NAME_PATTERN.sub(number_leaf, newick_string)
+
+def try_reformat_tree(line):
+    """Reformat one tree line, returning (reformatted tree, None) or (None, error)"""
+    try:
+        return reformat_tree(line), None
+    except Exception as e:
+        return None, e
 
 def main():
     # Set up argument parser
@@ -95,6 +71,10 @@ Examples:
     parser.add_argument('-v', '--verbose', 
                        action='store_true', 
                        help='Print detailed progress information')
+    parser.add_argument('-w', '--workers',
+                       type=int,
+                       default=None,
+                       help='Number of worker processes (default: number of CPUs)')
     
     # Parse arguments
     args = parser.parse_args()
@@ -103,28 +83,33 @@ Examples:
         # Open output file
         with open(args.output_file, 'w') as outfile:
             # Open and process input file
-            with open(args.input_file, 'r') as infile:
-                for i, line in enumerate(infile, 1):
-                    line = line.strip()
-                    if not line:
-                        continue  # Skip empty lines
+            # Trees are independent, so reformat them in parallel; map returns
+            # results in input order, so the output order is unchanged. Lines
+            # are streamed from the input one batch at a time
+            with open(args.input_file, 'r') as infile, \
+                    ProcessPoolExecutor(max_workers=args.workers) as executor:
+                numbered_lines = enumerate(infile, 1)
+                i = 0
+                for batch in iter(lambda: list(islice(numbered_lines, BATCH_SIZE)), []):
+                    i = batch[-1][0]
                     
-                    try:
-                        # Reformat the tree
-                        reformatted_tree = reformat_tree(line)
+                    # Skip empty lines
+                    batch = [(n, tree) for n, tree in ((n, line.strip()) for n, line in batch) if tree]
+                    results = executor.map(try_reformat_tree, (tree for _, tree in batch), chunksize=64)
+                    
+                    for (n, _), (reformatted_tree, error) in zip(batch, results):
+                        if error is not None:
+                            print(f"Warning: Could not process tree {n}, skipping. Error: {error}")
+                            continue
                         
                         # Write the reformatted tree to the output file
                         outfile.write(reformatted_tree + '\n')
                         
                         # Print progress
-                        if args.verbose and i % 100 == 0:
-                            print(f"Processed {i} trees...")
-                        elif i % 1000 == 0:
-                            print(f"Processed {i} trees...")
-                    
-                    except Exception as e:
-                        print(f"Warning: Could not process tree {i}, skipping. Error: {e}")
-                        continue
+                        if args.verbose and n % 100 == 0:
+                            print(f"Processed {n} trees...")
+                        elif n % 1000 == 0:
+                            print(f"Processed {n} trees...")
             
             print(f"Successfully processed {i} trees. Reformatted trees saved to {args.output_file}")
     
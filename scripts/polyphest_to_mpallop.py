@@ -7,54 +7,87 @@ Usage:
     python "/groups/itay_mayrose/tomulanovski/gene2net/scripts/polyphest_to_mpallop.py" gene_trees.txt output.nex
 """
 import sys
-import re
+from itertools import chain
+
+# Output is written through a large buffer, so it reaches the (network)
+# filesystem in a few big writes rather than many small ones
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Number of lines of the NEXUS file shown as a preview
+PREVIEW_LINES = 10
+
+# Newick is plain ASCII, so trees are handled as bytes end-to-end (no decode/encode)
+NEXUS_HEADER = [b"#NEXUS\n", b"BEGIN TREES;\n"]
+NEXUS_FOOTER = [
+    b"END;\n",
+    b"\n",
+    b"BEGIN PHYLONET;\n",
+    b"InferNetwork_MP_Allopp (all) 1 -x 1 -pl 12 -di;\n",
+    b"END;\n",
+]
+
+def iter_newick_trees(f_in, chunk_size=1 << 20):
+    """
+    Yield the Newick trees in an open binary file one at a time (as bytes),
+    without reading the whole file into memory.
+    Each tree runs from the first '(' after the previous semicolon up to and
+    including its own semicolon; line breaks inside a tree (\n, \r\n or \r)
+    become spaces. Text after the last semicolon is ignored.
+    """
+    # Bytes read since the last semicolon, joined only once one arrives (so a
+    # tree spanning many chunks is not re-copied and re-split per chunk)
+    pending = []
+    for chunk in iter(lambda: f_in.read(chunk_size), b''):
+        pieces = chunk.split(b';')
+        if len(pieces) == 1:
+            pending.append(chunk)
+            continue
+        pending.append(pieces[0])
+        pieces[0] = b''.join(pending)
+        # The last piece has no semicolon yet, keep it for the next chunk
+        pending = [pieces.pop()]
+        for piece in pieces:
+            start = piece.find(b'(')
+            if start != -1:
+                tree = piece[start:].replace(b'\r\n', b' ').replace(b'\r', b' ').replace(b'\n', b' ')
+                yield tree + b';'
 
 def create_nexus_file(input_file, output_file):
     """Convert Newick trees to NEXUS format, separating trees by semicolons."""
     try:
-        # Read the entire input file
-        with open(input_file, 'r') as f:
-            content = f.read()
-        
-        # Remove all whitespace for easier processing
-        content = content.replace('\n', ' ').replace('\r', '')
-        
-        # Find all trees by matching patterns ending with semicolons
-        # This regex matches content between parentheses ending with semicolons
-        tree_pattern = re.compile(r'(\([^;]*;)')
-        trees = tree_pattern.findall(content)
-        
-        # Clean up any extra whitespace in trees
-        trees = [tree.strip() for tree in trees if tree.strip()]
-        
-        if not trees:
-            print("Warning: No valid Newick trees found in the input file.")
-            return False
-        
-        # Write the NEXUS file
-        with open(output_file, 'w') as out:
-            # Write NEXUS header
-            out.write("#NEXUS\n")
+        with open(input_file, 'rb') as f_in:
+            # Trees are streamed from the input straight to the output
+            trees = iter_newick_trees(f_in)
+            first_tree = next(trees, None)
             
-            # Write TREES block
-            out.write("BEGIN TREES;\n")
-            for i, tree in enumerate(trees):
-                out.write(f"Tree geneTree{i+1} = {tree}\n")
-            out.write("END;\n")
+            if first_tree is None:
+                print("Warning: No valid Newick trees found in the input file.")
+                return False
             
-            # Add PHYLONET block
-            out.write("\nBEGIN PHYLONET;\n")
-            out.write("InferNetwork_MP_Allopp (all) 1 -x 1 -pl 12 -di;\n")
-            out.write("END;\n")
+            # Write the NEXUS file
+            # (the first lines written are kept for the preview, so the
+            # file does not need to be read back)
+            with open(output_file, 'wb', buffering=OUTPUT_BUFFER_SIZE) as out:
+                # Write NEXUS header and TREES block
+                out.writelines(NEXUS_HEADER)
+                preview_lines = list(NEXUS_HEADER)
+                n_trees = 0
+                for n_trees, tree in enumerate(chain([first_tree], trees), 1):
+                    line = b"Tree geneTree%d = %s\n" % (n_trees, tree)
+                    out.write(line)
+                    if len(preview_lines) < PREVIEW_LINES:
+                        preview_lines.append(line)
+                
+                # End the TREES block and add PHYLONET block
+                out.writelines(NEXUS_FOOTER)
+                preview_lines.extend(NEXUS_FOOTER)
         
-        print(f"Successfully converted {len(trees)} trees to NEXUS format in {output_file}")
+        print(f"Successfully converted {n_trees} trees to NEXUS format in {output_file}")
         
         # Display the first few lines of the output file
-        with open(output_file, 'r') as f:
-            preview_lines = f.readlines()
-            preview = "".join(preview_lines[:min(10, len(preview_lines))])
-            print("\nPreview of the NEXUS file:")
-            print(preview + "...\n")
+        preview = b"".join(preview_lines[:PREVIEW_LINES]).decode('utf-8', errors='replace')
+        print("\nPreview of the NEXUS file:")
+        print(preview + "...\n")
         
     except FileNotFoundError:
         print(f"Error: Input file '{input_file}' not found.")
@@ -1,5 +1,6 @@
 import re
-from ete3 import Tree
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 # File paths
 INPUT_FILE = "/groups/itay_mayrose/tomulanovski/gene2net/papers/Ren_2024/gene_trees/all_trees.tre"
@@ -24,45 +25,243 @@ TAXA_TO_KEEP = [
     'Helia'
 ]
 
+# Alternation of all taxa to keep (tried in list order), compiled once
+TAXA_ALTERNATION = '|'.join(re.escape(taxon) for taxon in TAXA_TO_KEEP)
+
 # Instead of specific exclusions, we'll use a pattern to exclude any taxon.something
-def should_keep_leaf(leaf_name):
+DOT_NOTATION_PATTERN = re.compile(rf'(?:{TAXA_ALTERNATION})\.')
+
+# The taxon exactly, or the taxon followed by an underscore
+# This prevents matching "RS265" with "RS2650" but allows "RS265_something"
+KEEP_PATTERN = re.compile(rf'({TAXA_ALTERNATION})(?:_|\Z)')
+
+def should_keep_leaf(leaf_name, log=None):
     """
     Determine if a leaf should be kept based on its name
+    Messages are appended to log if it is given, otherwise printed.
     Returns: (should_keep, taxon_matched)
     """
     # Check if the leaf name has a dot pattern (taxon.something)
-    for taxon in TAXA_TO_KEEP:
-        if leaf_name.startswith(taxon + '.'):
-            print(f"    Excluding dot-notation leaf: {leaf_name}")
-            return False, None
+    if DOT_NOTATION_PATTERN.match(leaf_name):
+        message = f"    Excluding dot-notation leaf: {leaf_name}"
+        if log is not None:
+            log.append(message)
+        else:
+            print(message)
+        return False, None
     
     # Then check if it matches any of our taxa to keep
-    for taxon in TAXA_TO_KEEP:
-        # Check if the leaf name is exactly the taxon or starts with the taxon followed by non-alphabetic character
-        # This prevents matching "RS265" with "RS2650" but allows "RS265_something"
-        if leaf_name == taxon or leaf_name.startswith(taxon + '_') or leaf_name.startswith(taxon + '.'):
-            return True, taxon
+    match = KEEP_PATTERN.match(leaf_name)
+    if match:
+        return True, match.group(1)
             
     # Default case: don't keep
     return False, None
 
+# Bracket comments, including NHX annotations such as [&&NHX:x=1]
+COMMENT_PATTERN = re.compile(r'\[[^\]]*\]')
+
+# Newick tokens: structure characters, or a run of anything else (name or length)
+NEWICK_TOKEN_PATTERN = re.compile(r'[(),:;]|[^(),:;]+')
+
+# Branch length written for nodes that have none (ete3's default dist)
+DEFAULT_DIST = 1.0
+
+def parse_newick(tree_str):
+    """
+    Parse a Newick string into nested [name, dist, children] lists.
+    Much lighter than building an ete3 Tree; internal node labels are kept
+    as names (like ete3 format=1) and missing branch lengths are None.
+    Bracket comments and NHX annotations are dropped, as ete3 does not write
+    them back in format=1 either.
+    """
+    if '[' in tree_str:
+        tree_str = COMMENT_PATTERN.sub('', tree_str)
+    tree_str = tree_str.strip()
+    if not (tree_str.startswith('(') and tree_str.endswith(';')):
+        raise ValueError("Malformed newick tree structure")
+    
+    root = None
+    open_nodes = []     # internal nodes whose ')' has not been seen yet
+    current = None      # node that a following name or ':length' belongs to
+    expect_dist = False
+    
+    def add_leaf(name):
+        leaf = [name, None, []]
+        open_nodes[-1][2].append(leaf)
+        return leaf
+    
+    for token in NEWICK_TOKEN_PATTERN.findall(tree_str):
+        if token == '(':
+            node = ['', None, []]
+            if open_nodes:
+                open_nodes[-1][2].append(node)
+            elif root is None:
+                root = node
+            else:
+                raise ValueError("Malformed newick tree structure")
+            open_nodes.append(node)
+            current = None
+        elif token in ',)':
+            if not open_nodes:
+                raise ValueError("Unbalanced parentheses in newick tree")
+            # An empty leaf, as in "(A,)"
+            if current is None:
+                add_leaf('')
+            current = open_nodes.pop() if token == ')' else None
+        elif token == ':':
+            if current is None:
+                current = add_leaf('')
+            expect_dist = True
+        elif token == ';':
+            break
+        else:
+            text = token.strip()
+            if expect_dist:
+                current[1] = float(text)
+                expect_dist = False
+            elif text:
+                if current is None:
+                    current = add_leaf(text)
+                else:
+                    current[0] = text
+    
+    if open_nodes:
+        raise ValueError("Unbalanced parentheses in newick tree")
+    
+    return root
+
+def iter_nodes(root):
+    """Yield all nodes in preorder (parents before their children)"""
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node[2]))
+
+def iter_postorder(root):
+    """Yield all nodes in postorder (children, left to right, before their parent)"""
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded or not node[2]:
+            yield node
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node[2]))
+
+def prune_newick(root, names_to_keep):
+    """
+    Keep only the named leaves, exactly as ete3's prune() does.
+    The kept nodes are the named leaves, the root, and every node where kept
+    leaves from two or more of its children meet - except the common ancestor
+    of all kept leaves, whose place is taken by the root. All other nodes are
+    deleted in postorder: each is removed from its parent and its children
+    (with their own branch lengths) are appended to the parent's children,
+    which is why ete3 can change the order of children.
+    
+    >>> tree = parse_newick('((RSC01:1,RSC02:2):3,Bar:4);')
+    >>> write_newick(prune_newick(tree, ['RSC01', 'RSC02']))
+    '(RSC01:1,RSC02:2);'
+    >>> tree = parse_newick('((RSC01:1[&&NHX:x=1],RSC02:2):3,Bar:4);')
+    >>> write_newick(prune_newick(tree, ['RSC01', 'RSC02']))
+    '(RSC01:1,RSC02:2);'
+    """
+    keep = set(names_to_keep)
+    
+    # ete3 refuses names that match more than one node
+    seen = set()
+    for node in iter_nodes(root):
+        if node[0] in keep:
+            if node[0] in seen:
+                raise ValueError(f"Ambiguous node name: {node[0]}")
+            seen.add(node[0])
+    
+    # Decide which nodes to keep (on the tree as it was read)
+    postorder = list(iter_postorder(root))
+    kept_below = {}
+    to_keep = {id(root)}
+    for node in postorder:
+        if not node[2]:
+            kept_below[id(node)] = int(node[0] in keep)
+            if node[0] in keep:
+                to_keep.add(id(node))
+            continue
+        counts = [kept_below[id(child)] for child in node[2]]
+        kept_below[id(node)] = sum(counts)
+        if len(counts) - counts.count(0) > 1 and kept_below[id(node)] < len(seen):
+            to_keep.add(id(node))
+    
+    # Delete the others, children before parents
+    parents = {id(child): node for node in postorder for child in node[2]}
+    for node in postorder:
+        if id(node) in to_keep:
+            continue
+        parent = parents[id(node)]
+        siblings = parent[2]
+        # (nodes are lists, so find this one by identity rather than equality)
+        del siblings[next(i for i, sibling in enumerate(siblings) if sibling is node)]
+        siblings.extend(node[2])
+        for child in node[2]:
+            parents[id(child)] = parent
+    
+    return root
+
+def write_newick(root):
+    """Write nested [name, dist, children] lists as ete3's write(format=1) would"""
+    def label(node):
+        dist = DEFAULT_DIST if node[1] is None else node[1]
+        return f"{node[0]}:{dist:0.6g}"
+    
+    parts = []
+    stack = [(root, False)]
+    while stack:
+        node, closing = stack.pop()
+        if node is None:
+            parts.append(',')
+        elif closing:
+            parts.append(')')
+            if node is not root:
+                parts.append(label(node))
+        elif node[2]:
+            parts.append('(')
+            stack.append((node, True))
+            for i, child in enumerate(reversed(node[2])):
+                if i:
+                    stack.append((None, False))
+                stack.append((child, False))
+        else:
+            parts.append(label(node))
+    
+    return ''.join(parts) + ';'
+
 def process_tree(tree_str, tree_idx):
-    """Process a single tree string"""
+    """
+    Process a single tree string.
+    Returns (pruned tree string or None, list of log lines); the log is
+    returned rather than printed so the caller can print it in tree order
+    when trees are processed in parallel.
+    
+    >>> process_tree('((RSC01:1[&&NHX:x=1],RSC02:2):3,Bar:4);', 1)[0]
+    '(RSC01:1,RSC02:2);'
+    """
+    log = []
     try:
-        # Parse the tree string
-        tree = Tree(tree_str, format=1)
+        # Parse the tree string (as nested lists, working on the Newick
+        # structure directly instead of building an ete3 Tree)
+        tree = parse_newick(tree_str)
         
         # Collect all leaves
-        all_leaves = list(tree.get_leaves())
+        all_leaves = [node for node in iter_nodes(tree) if not node[2]]
         
-        print(f"Tree {tree_idx}: Total leaves: {len(all_leaves)}")
+        log.append(f"Tree {tree_idx}: Total leaves: {len(all_leaves)}")
         
         # Identify leaves to keep
         leaves_to_keep = []
         taxa_counts = {taxon: 0 for taxon in TAXA_TO_KEEP}  # To count how many of each taxon we keep
         
         for leaf in all_leaves:
-            keep_leaf, matched_taxon = should_keep_leaf(leaf.name)
+            keep_leaf, matched_taxon = should_keep_leaf(leaf[0], log)
             
             if keep_leaf:
                 leaves_to_keep.append(leaf)
@@ -72,29 +271,41 @@ def process_tree(tree_str, tree_idx):
         # Report on taxa found
         for taxon, count in taxa_counts.items():
             if count > 0:
-                print(f"  {taxon}: keeping all {count} copies")
+                log.append(f"  {taxon}: keeping all {count} copies")
             else:
-                print(f"  Warning: Taxon {taxon} not found in tree {tree_idx}")
+                log.append(f"  Warning: Taxon {taxon} not found in tree {tree_idx}")
         
         # Get the names of leaves to keep
-        names_to_keep = [leaf.name for leaf in leaves_to_keep]
+        names_to_keep = [leaf[0] for leaf in leaves_to_keep]
         
         # Prune the tree to keep only the selected leaves
-        print(f"  Pruning tree {tree_idx} to keep {len(names_to_keep)} leaves...")
+        log.append(f"  Pruning tree {tree_idx} to keep {len(names_to_keep)} leaves...")
         
         # If we have any leaves to keep, prune and return the tree
         if names_to_keep:
-            tree.prune(names_to_keep)
-            return tree.write(format=1)
+            prune_newick(tree, names_to_keep)
+            return write_newick(tree), log
         else:
-            print(f"  Warning: No leaves to keep in tree {tree_idx}")
-            return None
+            log.append(f"  Warning: No leaves to keep in tree {tree_idx}")
+            return None, log
             
     except Exception as e:
-        print(f"Error processing tree {tree_idx}: {e}")
-        return None
+        log.append(f"Error processing tree {tree_idx}: {e}")
+        return None, log
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Prune gene trees to the leaves of the selected taxa",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Number of worker processes (default: number of CPUs)')
+    return parser.parse_args()
 
 def main():
+    args = parse_arguments()
+    
     # Read all trees from input file
     try:
         with open(INPUT_FILE, 'r') as f:
@@ -116,13 +327,18 @@ def main():
     
     print(f"Found {len(tree_strings)} trees in input file")
     
-    # Process each tree and collect the pruned versions
+    # Trees are independent, so process them in parallel and collect the
+    # pruned versions. map keeps the input order, so each tree's log is
+    # printed in order as its result arrives
     pruned_trees = []
-    for i, tree_str in enumerate(tree_strings):
-        print(f"Processing tree {i+1}/{len(tree_strings)}")
-        pruned_tree = process_tree(tree_str, i+1)
-        if pruned_tree:
-            pruned_trees.append(pruned_tree)
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        results = executor.map(process_tree, tree_strings,
+                               range(1, len(tree_strings) + 1), chunksize=64)
+        for i, (pruned_tree, log) in enumerate(results, 1):
+            print(f"Processing tree {i}/{len(tree_strings)}")
+            print("\n".join(log))
+            if pruned_tree:
+                pruned_trees.append(pruned_tree)
     
     # Write all pruned trees to the output file
     with open(OUTPUT_FILE, 'w') as f:
@@ -10,6 +10,23 @@ import re
 import sys
 import os
 import argparse
+import string
+
+# Bracketed comments, removed before looking for taxa
+COMMENT_PATTERN = re.compile(r'\[[^\]]*\]')
+
+# Newick delimiters; splitting on this (capturing) pattern alternates
+# text segments and the delimiters between them
+DELIMITER_PATTERN = re.compile(r'([(),:;])')
+
+# Quoted labels, including periods
+QUOTED_TAXON_PATTERN = re.compile(r'[\'"]([A-Za-z][A-Za-z0-9_.]*)[\'"]')
+
+# Characters allowed in a taxon (which must start with a letter): a label at
+# the beginning may include periods, one after a delimiter also special chars
+LETTERS = string.ascii_letters
+LEADING_TAXON_CHARS = LETTERS + string.digits + '_.'
+TAXON_CHARS = LEADING_TAXON_CHARS + '+-'
 
 def extract_taxa_from_nexus(nexus_file):
     """Extract all taxa names from a NEXUS file."""
@@ -46,23 +63,30 @@ def extract_taxa_from_nexus(nexus_file):
 def extract_taxa_from_newick_content(content):
     """Extract taxa from Newick string content."""
     # Remove comments and quoted labels
-    clean_content = re.sub(r'\[[^\]]*\]', '', content)
-    
-    # Multiple regex patterns to catch all possible taxa formats
-    patterns = [
-        r'(?<=[(:,])([A-Za-z][A-Za-z0-9_.]*)(?=[:),])',  # Standard pattern, including periods
-        r'^([A-Za-z][A-Za-z0-9_.]*)(?=[:),])',           # At beginning, including periods
-        r'[\'"]([A-Za-z][A-Za-z0-9_.]*)[\'"]',           # With quotes, including periods
-        r'(?<=[(:,])([A-Za-z][A-Za-z0-9_.+-]*)(?=[:),])' # With special chars, including periods
-    ]
+    clean_content = COMMENT_PATTERN.sub('', content) if '[' in content else content
     
+    # Split once into segments; a taxon is a whole segment (the delimiters
+    # around it are at the odd positions). Taxa start with a letter, so
+    # completely numeric strings are never picked up
+    parts = DELIMITER_PATTERN.split(clean_content)
     all_taxa = set()
-    for pattern in patterns:
-        taxa = re.findall(pattern, clean_content)
-        all_taxa.update(taxa)
     
-    # Filter out any completely numeric strings
-    all_taxa = {t for t in all_taxa if not re.match(r'^\d+$', t)}
+    # At beginning, followed by one of ':),'
+    first = parts[0]
+    if (len(parts) > 1 and first and first[0] in LETTERS and parts[1] in ':),'
+            and not first.strip(LEADING_TAXON_CHARS)):
+        all_taxa.add(first)
+    
+    # After one of '(:,' and followed by one of ':),'
+    for i in range(2, len(parts) - 1, 2):
+        segment = parts[i]
+        if (segment and segment[0] in LETTERS and parts[i - 1] in '(:,' and parts[i + 1] in ':),'
+                and not segment.strip(TAXON_CHARS)):
+            all_taxa.add(segment)
+    
+    # With quotes
+    if "'" in clean_content or '"' in clean_content:
+        all_taxa.update(QUOTED_TAXON_PATTERN.findall(clean_content))
     
     return all_taxa
 
@@ -2,8 +2,6 @@
 import sys
 import csv
 import os
-from Bio import AlignIO
-from Bio.Align import MultipleSeqAlignment
 
 '''
 python script that takes copies tsv file and input and output dir and reduce the fasta files in input dir to the labels in the tsv file and write them with _reduce extension in the name to the output dir
@@ -19,7 +17,6 @@ if len(sys.argv) != 4:
 tsv_file = sys.argv[1]
 input_dir = sys.argv[2]
 output_dir = sys.argv[3]
-file_format = "fasta"  # change if needed
 
 # Read first column of TSV (skip header)
 labels_to_keep = set()
@@ -32,6 +29,9 @@ with open(tsv_file, newline="") as f:
 
 print(f"Loaded {len(labels_to_keep)} labels from {tsv_file}")
 
+# FASTA files are scanned as raw bytes, so compare IDs as bytes too
+labels_to_keep_bytes = {label.encode() for label in labels_to_keep}
+
 # Make sure output directory exists
 os.makedirs(output_dir, exist_ok=True)
 
@@ -45,14 +45,20 @@ for filename in os.listdir(input_dir):
         output_filename = f"{name}_reduced{ext}"
         output_path = os.path.join(output_dir, output_filename)
         
-        # Read alignment
-        alignment = AlignIO.read(input_path, file_format)
-        
-        # Filter by exact ID match
-        filtered_records = [rec for rec in alignment if rec.id in labels_to_keep]
-        
-        # Write filtered alignment
-        AlignIO.write(MultipleSeqAlignment(filtered_records), output_path, file_format)
+        # Copy the kept records line by line without parsing them: a header
+        # line decides (by exact match of its ID, the first word) whether it
+        # and the sequence lines up to the next header are written
+        n_total = n_kept = 0
+        keep = False
+        with open(input_path, 'rb') as f_in, open(output_path, 'wb') as f_out:
+            for line in f_in:
+                if line.startswith(b'>'):
+                    n_total += 1
+                    header = line[1:].split(None, 1)
+                    keep = (header[0] if header else b'') in labels_to_keep_bytes
+                    n_kept += keep
+                if keep:
+                    f_out.write(line)
         
-        print(f"{filename}: kept {len(filtered_records)} sequences out of {len(alignment)}")
+        print(f"{filename}: kept {n_kept} sequences out of {n_total}")
         print(f"Saved filtered alignment to: {output_path}")
@@ -1,5 +1,5 @@
 import dendropy
-import itertools
+from collections import defaultdict
 
 def get_species_name(taxon_label):
     """Extract species name from the full taxon label."""
@@ -37,31 +37,50 @@ def reduce_tree(input_tree_path, output_tree_path):
     nodes_to_remove = set()
     subgroups_found = 0
     
+    # Encode bipartitions once (as the first tree.mrca() call would). A
+    # subgroup is monophyletic exactly when it is the leaf set of some node,
+    # so one postorder pass collects, per species, the leaf bitmasks of the
+    # clades whose leaves all belong to that species
+    species_clades = defaultdict(set)
+    if any(len(nodes) > 1 for nodes in species_groups.values()):
+        tree.encode_bipartitions()
+        clade_species = {}
+        for node in tree.postorder_node_iter():
+            if node.is_leaf():
+                clade_species[node] = get_species_name(node.taxon.label)
+                continue
+            child_species = {clade_species[child] for child in node.child_node_iter()}
+            clade_species[node] = child_species.pop() if len(child_species) == 1 else None
+            if clade_species[node] is not None:
+                species_clades[clade_species[node]].add(node.edge.bipartition.leafset_bitmask)
+    
     for species, nodes in species_groups.items():
         if len(nodes) > 1:  # Multiple accessions exist
             # Get all possible subgroups with at least 2 members
             species_nodes_to_remove = set()
             
-            # Check all subgroups, starting with largest
-            for size in range(len(nodes), 1, -1):
-                for subgroup in itertools.combinations(nodes, size):
-                    # Skip if any node in this subgroup is already marked for removal
-                    if any(node in species_nodes_to_remove for node in subgroup):
-                        continue
-                        
-                    # Get the mrca of this subgroup
-                    mrca = tree.mrca(taxa=[node.taxon for node in subgroup])
-                    # Check if subgroup is monophyletic
-                    descendants = set([leaf.taxon for leaf in mrca.leaf_nodes()])
-                    subgroup_taxa = set([node.taxon for node in subgroup])
-                    
-                    if descendants == subgroup_taxa:  # Subgroup is monophyletic
-                        subgroups_found += 1
-                        print(f"Found monophyletic subgroup for {species} with {len(subgroup)} accessions")
-                        print(f"  Keeping: {subgroup[0].taxon.label}")
-                        print(f"  Removing: {[node.taxon.label for node in subgroup[1:]]}")
-                        # Mark for removal (keep first one)
-                        species_nodes_to_remove.update(subgroup[1:])
+            # The monophyletic subgroups are this species' clades; rather than
+            # testing every combination of accessions, check just these,
+            # starting with largest (ties in the order the accessions appear)
+            positions = {node: i for i, node in enumerate(nodes)}
+            subgroups = []
+            for mask in species_clades[species]:
+                subgroup = [node for node in nodes if node.edge.bipartition.leafset_bitmask & mask]
+                if len(subgroup) > 1:
+                    subgroups.append(subgroup)
+            subgroups.sort(key=lambda subgroup: (-len(subgroup), [positions[node] for node in subgroup]))
+            
+            for subgroup in subgroups:
+                # Skip if any node in this subgroup is already marked for removal
+                if any(node in species_nodes_to_remove for node in subgroup):
+                    continue
+                
+                subgroups_found += 1
+                print(f"Found monophyletic subgroup for {species} with {len(subgroup)} accessions")
+                print(f"  Keeping: {subgroup[0].taxon.label}")
+                print(f"  Removing: {[node.taxon.label for node in subgroup[1:]]}")
+                # Mark for removal (keep first one)
+                species_nodes_to_remove.update(subgroup[1:])
             
             # Add this species' nodes to the global removal set
             nodes_to_remove.update(species_nodes_to_remove)
@@ -73,18 +73,22 @@ def calculate_tree_height(tree_file):
     try:
         tree = Phylo.read(tree_file, 'newick')
         
-        # Get all terminal (leaf) nodes
-        terminals = tree.get_terminals()
+        # Calculate distance from root to each leaf in one preorder pass:
+        # a clade's depth is its parent's depth plus its own branch length
+        # (tree.distance per leaf would search the tree again for every leaf)
+        root_to_leaf_distances = []
+        stack = [(tree.root, 0.0)]
+        while stack:
+            clade, depth = stack.pop()
+            if clade.clades:
+                for child in reversed(clade.clades):
+                    stack.append((child, depth + (child.branch_length or 0)))
+            else:
+                root_to_leaf_distances.append(depth)
         
-        if not terminals:
+        if not root_to_leaf_distances:
             return None
         
-        # Calculate distance from root to each leaf
-        root_to_leaf_distances = []
-        for terminal in terminals:
-            distance = tree.distance(tree.root, terminal)
-            root_to_leaf_distances.append(distance)
-        
         # Return average root-to-leaf distance
         return np.mean(root_to_leaf_distances)
         
@@ -1,20 +1,18 @@
 #!/usr/bin/env python3
 """
 Extract alignment lengths from FASTA files across multiple datasets.
-Outputs: CSV statistics, PNG visualization, and pickle file for sampling.
+Outputs: CSV statistics, PNG visualization (skip with --no-plot), and pickle file for sampling.
 """
 
 import os
+import mmap
 import pickle
+import argparse
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
-from Bio import SeqIO
 
 # Dataset paths
 DATASETS = {
@@ -26,28 +24,74 @@ DATASETS = {
 OUTPUT_DIR = Path('/groups/itay_mayrose/tomulanovski/gene2net/simulations/distributions')
 
 
+def parse_arguments():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Extract alignment lengths from FASTA files across datasets',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    
+    parser.add_argument(
+        '--no-plot',
+        action='store_true',
+        help='Skip the PNG visualization (only write CSV and pickle)'
+    )
+    
+    return parser.parse_args()
+
+
 def get_alignment_length(fasta_file):
-    """Get alignment length from a FASTA file."""
+    """Get alignment length from a FASTA file.
+
+    All sequences in an alignment have the same length, so only the first
+    record is read (no need to parse the whole file). The file is memory-mapped
+    and the record boundaries are located with mmap.find.
+    """
     try:
-        records = list(SeqIO.parse(fasta_file, 'fasta'))
-        if records:
-            return len(records[0].seq)
+        if os.path.getsize(fasta_file) == 0:
+            return None
+        with open(fasta_file, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Start of the first header line
+            header = 0 if mm[:1] == b'>' else mm.find(b'\n>') + 1
+            if header == 0 and mm[:1] != b'>':
+                return None
+            seq_start = mm.find(b'\n', header)
+            if seq_start == -1:
+                return 0
+            # Sequence runs until the next header line (or end of file)
+            seq_end = mm.find(b'\n>', seq_start)
+            if seq_end == -1:
+                seq_end = len(mm)
+            return len(b''.join(mm[seq_start:seq_end].split()))
     except Exception as e:
         print(f"Error reading {fasta_file}: {e}")
     return None
 
 
-def collect_alignment_lengths(base_dir):
-    """Collect alignment lengths from all FASTA files in directory."""
-    lengths = []
-    fasta_extensions = ['.fasta', '.fa', '.fna', '.fas', '.aln-cln']
-    
-    base_path = Path(base_dir)
-    for ext in fasta_extensions:
-        for fasta_file in base_path.glob(f'*{ext}'):
-            length = get_alignment_length(fasta_file)
-            if length:
-                lengths.append(length)
+def collect_alignment_lengths(base_dir, max_workers=None):
+    """Collect alignment lengths from all FASTA files in directory.
+
+    Files are parsed in parallel across max_workers processes
+    (default: one per CPU).
+    """
+    fasta_extensions = ('.fasta', '.fa', '.fna', '.fas', '.aln-cln')
+    
+    if not os.path.isdir(base_dir):
+        return []
+    
+    # One directory pass for all extensions (like glob, this includes dotfiles)
+    with os.scandir(base_dir) as entries:
+        fasta_files = sorted(
+            entry.path for entry in entries
+            if entry.name.endswith(fasta_extensions) and entry.is_file()
+        )
+    if not fasta_files:
+        return []
+    
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(get_alignment_length, fasta_files, chunksize=16)
+        lengths = [length for length in results if length]
     
     return lengths
 
@@ -57,21 +101,30 @@ def calculate_statistics(lengths, dataset_name):
     if not lengths:
         return None
     
+    # Convert once and get all quantiles from a single percentile call
+    arr = np.asarray(lengths, dtype=np.int64)
+    q1, median, q3 = np.percentile(arr, [25, 50, 75])
+    
     return {
         'Dataset': dataset_name,
-        'N_genes': len(lengths),
-        'Min': np.min(lengths),
-        'Max': np.max(lengths),
-        'Mean': np.mean(lengths),
-        'Median': np.median(lengths),
-        'Std': np.std(lengths),
-        'Q1': np.percentile(lengths, 25),
-        'Q3': np.percentile(lengths, 75)
+        'N_genes': arr.size,
+        'Min': arr.min(),
+        'Max': arr.max(),
+        'Mean': arr.mean(),
+        'Median': median,
+        'Std': arr.std(),
+        'Q1': q1,
+        'Q3': q3
     }
 
 
 def create_visualizations(all_lengths, output_path):
     """Create visualization of alignment length distributions."""
+    # Imported here so runs with --no-plot don't pay for matplotlib
+    import matplotlib
+    matplotlib.use('Agg')  # Non-interactive backend
+    import matplotlib.pyplot as plt
+    
     fig, axes = plt.subplots(2, 2, figsize=(15, 12))
     
     # Prepare data for plotting
@@ -133,6 +186,8 @@ def create_visualizations(all_lengths, output_path):
 
 def main():
     """Main execution function."""
+    args = parse_arguments()
+    
     # Create output directory
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     
@@ -149,9 +204,9 @@ def main():
             all_lengths[dataset_name] = lengths
             stats = calculate_statistics(lengths, dataset_name)
             stats_list.append(stats)
-            print(f"  Found {len(lengths)} alignments")
-            print(f"  Length range: {min(lengths)} - {max(lengths)} bp")
-            print(f"  Mean: {np.mean(lengths):.1f} bp, Median: {np.median(lengths):.1f} bp")
+            print(f"  Found {stats['N_genes']} alignments")
+            print(f"  Length range: {stats['Min']} - {stats['Max']} bp")
+            print(f"  Mean: {stats['Mean']:.1f} bp, Median: {stats['Median']:.1f} bp")
         else:
             print(f"  No FASTA files found in {base_dir}")
     
@@ -173,8 +228,9 @@ def main():
     print(f"Raw data saved to {pkl_path}")
     
     # Create visualizations
-    png_path = OUTPUT_DIR / 'alignment_lengths.png'
-    create_visualizations(all_lengths, png_path)
+    if not args.no_plot:
+        png_path = OUTPUT_DIR / 'alignment_lengths.png'
+        create_visualizations(all_lengths, png_path)
     
     # Print summary
     print("\n" + "="*60)
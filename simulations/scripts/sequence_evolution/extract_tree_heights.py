@@ -2,20 +2,16 @@
 """
 Extract tree heights (average root-to-leaf distances) from gene trees.
 These will be used to calculate substitution rates once divergence times are available.
-Outputs: CSV statistics, PNG visualization, and pickle file for sampling.
+Outputs: CSV statistics, PNG visualization (skip with --no-plot), and pickle file for sampling.
 """
 
 import os
 import pickle
+import argparse
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
-from Bio import Phylo
-from io import StringIO
 
 # Dataset paths
 DATASETS = {
@@ -27,47 +23,136 @@ DATASETS = {
 OUTPUT_DIR = Path('/groups/itay_mayrose/tomulanovski/gene2net/simulations/distributions')
 
 
+def parse_arguments():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Extract tree heights (average root-to-leaf distances) from gene trees',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    
+    parser.add_argument(
+        '--no-plot',
+        action='store_true',
+        help='Skip the PNG visualization (only write CSV and pickle)'
+    )
+    
+    return parser.parse_args()
+
+
+def mean_leaf_depth(newick):
+    """
+    Mean root-to-leaf distance of the first tree in a Newick string, in one scan.
+    Each branch lies on the path to every leaf below it, so the sum of all
+    leaf depths is the sum of branch_length * (leaves below the branch); a
+    clade's leaf count is known when its ')' is reached, just before its
+    ':length'. No tree is built. Labels, support values and [comments] are
+    skipped; the root's own branch length is not counted.
+    """
+    total = 0.0
+    n_leaves = 0
+    open_counts = []    # leaves seen so far under each clade whose ')' is pending
+    current = None      # leaves below the node that a following ':length' belongs to
+    i, n = 0, len(newick)
+    
+    while i < n:
+        char = newick[i]
+        if char == '(':
+            open_counts.append(0)
+            current = None
+            i += 1
+        elif char in ',)':
+            # An empty leaf, as in "(A,)"
+            if current is None:
+                n_leaves += 1
+                open_counts[-1] += 1
+            if char == ')':
+                count = open_counts.pop()
+                if open_counts:
+                    open_counts[-1] += count
+                current = count if open_counts else 0
+            else:
+                current = None
+            i += 1
+        elif char == ';':
+            break
+        elif char == '[':
+            end = newick.find(']', i)
+            i = n if end == -1 else end + 1
+        elif char.isspace():
+            i += 1
+        else:
+            if current is None:
+                # Start of a leaf
+                n_leaves += 1
+                if open_counts:
+                    open_counts[-1] += 1
+                current = 1 if open_counts else 0
+            if char == ':':
+                start = i = i + 1
+                while i < n and newick[i] not in ',);[':
+                    i += 1
+                total += float(newick[start:i]) * current
+            elif char == "'":
+                # Quoted label; '' inside it is an escaped quote
+                i += 1
+                while i < n:
+                    if newick[i] == "'":
+                        if newick[i + 1:i + 2] != "'":
+                            break
+                        i += 1
+                    i += 1
+                i += 1
+            else:
+                while i < n and newick[i] not in '(),:;[' and not newick[i].isspace():
+                    i += 1
+    
+    if open_counts:
+        raise ValueError("Unbalanced parentheses in Newick tree")
+    if not n_leaves:
+        raise ValueError("There are no trees in this file")
+    
+    return total / n_leaves
+
+
 def calculate_tree_height(tree_file):
     """
     Calculate average root-to-leaf distance (tree height) from a phylogenetic tree.
     Returns the mean path length from root to all leaves.
     """
     try:
-        tree = Phylo.read(tree_file, 'newick')
-        
-        # Get all terminal (leaf) nodes
-        terminals = tree.get_terminals()
-        
-        if not terminals:
-            return None
-        
-        # Calculate distance from root to each leaf
-        root_to_leaf_distances = []
-        for terminal in terminals:
-            distance = tree.distance(tree.root, terminal)
-            root_to_leaf_distances.append(distance)
-        
-        # Return average root-to-leaf distance
-        return np.mean(root_to_leaf_distances)
+        with open(tree_file, 'r') as f:
+            return mean_leaf_depth(f.read())
         
     except Exception as e:
         print(f"Error processing {tree_file}: {e}")
         return None
 
 
-def collect_tree_heights(base_dir):
-    """Collect tree heights from all .treefile files in subdirectories."""
+def collect_tree_heights(base_dir, max_workers=None):
+    """Collect tree heights from all .treefile files in subdirectories.
+
+    Trees are independent, so they are processed in parallel across
+    max_workers processes (default: one per CPU).
+    """
     tree_heights = []
     
-    base_path = Path(base_dir)
-    
-    # Find all .treefile files in subdirectories
-    tree_files = list(base_path.rglob('*.treefile'))
+    # Find all .treefile files in subdirectories (os.walk lists each directory
+    # once with scandir, without building a Path object per entry)
+    tree_files = sorted(
+        os.path.join(root, name)
+        for root, _, files in os.walk(base_dir)
+        for name in files if name.endswith('.treefile')
+    )
     
     print(f"  Found {len(tree_files)} .treefile files")
     
-    for tree_file in tree_files:
-        height = calculate_tree_height(tree_file)
+    if not tree_files:
+        return tree_heights
+    
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        heights = list(executor.map(calculate_tree_height, tree_files, chunksize=32))
+    
+    for tree_file, height in zip(tree_files, heights):
         if height is not None:
             tree_heights.append({
                 'height': height,
@@ -77,13 +162,11 @@ def collect_tree_heights(base_dir):
     return tree_heights
 
 
-def calculate_statistics(heights_data, dataset_name):
-    """Calculate summary statistics for tree heights."""
-    if not heights_data:
+def calculate_statistics(heights, dataset_name):
+    """Calculate summary statistics for an array of tree heights."""
+    if len(heights) == 0:
         return None
     
-    heights = [d['height'] for d in heights_data]
-    
     return {
         'Dataset': dataset_name,
         'N_genes': len(heights),
@@ -98,23 +181,26 @@ def calculate_statistics(heights_data, dataset_name):
 
 
 def create_visualizations(all_heights, output_path):
-    """Create visualization of tree height distributions."""
+    """Create visualization of tree height distributions.
+    
+    all_heights maps each dataset name to an array of its tree heights.
+    """
+    # Imported here so runs with --no-plot don't pay for matplotlib
+    import matplotlib
+    matplotlib.use('Agg')  # Non-interactive backend
+    import matplotlib.pyplot as plt
+    
     fig, axes = plt.subplots(2, 2, figsize=(15, 12))
     
     # Prepare data for plotting
-    datasets = []
-    heights = []
-    for dataset_name, heights_data in all_heights.items():
-        dataset_heights = [d['height'] for d in heights_data]
-        datasets.extend([dataset_name] * len(dataset_heights))
-        heights.extend(dataset_heights)
+    heights = np.concatenate(list(all_heights.values()))
+    datasets = np.repeat(list(all_heights.keys()), [len(h) for h in all_heights.values()])
     
     df = pd.DataFrame({'Dataset': datasets, 'Height': heights})
     
     # 1. Histograms for each dataset
     ax1 = axes[0, 0]
-    for dataset_name, heights_data in all_heights.items():
-        dataset_heights = [d['height'] for d in heights_data]
+    for dataset_name, dataset_heights in all_heights.items():
         ax1.hist(dataset_heights, alpha=0.6, label=dataset_name, bins=30)
     ax1.set_xlabel('Tree Height (substitutions/site)', fontsize=12)
     ax1.set_ylabel('Frequency', fontsize=12)
@@ -147,11 +233,7 @@ def create_visualizations(all_heights, output_path):
     
     # 4. Violin plot
     ax4 = axes[1, 1]
-    dataset_heights = [
-        [d['height'] for d in all_heights[ds]] 
-        for ds in all_heights.keys()
-    ]
-    parts = ax4.violinplot(dataset_heights,
+    parts = ax4.violinplot(list(all_heights.values()),
                            positions=range(len(all_heights)),
                            showmeans=True, showmedians=True)
     ax4.set_xticks(range(len(all_heights)))
@@ -161,19 +243,22 @@ def create_visualizations(all_heights, output_path):
     ax4.grid(True, alpha=0.3)
     
     plt.tight_layout()
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    plt.savefig(output_path, dpi=150, bbox_inches='tight')
     print(f"Visualization saved to {output_path}")
     plt.close()
 
 
 def main():
     """Main execution function."""
+    args = parse_arguments()
+    
     # Create output directory
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     
     # Collect tree heights from all datasets
     print("Collecting tree heights from gene trees...")
     all_heights = {}
+    height_arrays = {}  # heights only, one array per dataset, for statistics and plots
     stats_list = []
     
     for dataset_name, base_dir in DATASETS.items():
@@ -182,17 +267,18 @@ def main():
         
         if heights_data:
             all_heights[dataset_name] = heights_data
-            stats = calculate_statistics(heights_data, dataset_name)
+            heights = np.asarray([d['height'] for d in heights_data])
+            height_arrays[dataset_name] = heights
+            stats = calculate_statistics(heights, dataset_name)
             stats_list.append(stats)
-            heights = [d['height'] for d in heights_data]
             print(f"  Processed {len(heights)} trees")
-            print(f"  Height range: {min(heights):.6f} - {max(heights):.6f} substitutions/site")
+            print(f"  Height range: {heights.min():.6f} - {heights.max():.6f} substitutions/site")
             print(f"  Mean: {np.mean(heights):.6f}, Median: {np.median(heights):.6f}")
         else:
             print(f"  No valid tree files found in {base_dir}")
     
     # Calculate combined statistics
-    combined_heights = [d for heights_data in all_heights.values() for d in heights_data]
+    combined_heights = np.concatenate(list(height_arrays.values())) if height_arrays else np.array([])
     combined_stats = calculate_statistics(combined_heights, 'Combined')
     stats_list.append(combined_stats)
     
@@ -209,8 +295,9 @@ def main():
     print(f"Raw data saved to {pkl_path}")
     
     # Create visualizations
-    png_path = OUTPUT_DIR / 'tree_heights.png'
-    create_visualizations(all_heights, png_path)
+    if not args.no_plot:
+        png_path = OUTPUT_DIR / 'tree_heights.png'
+        create_visualizations(height_arrays, png_path)
     
     # Print summary
     print("\n" + "="*60)
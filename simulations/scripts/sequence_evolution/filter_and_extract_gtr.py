@@ -4,13 +4,14 @@ Filter alignments by quality criteria, then extract GTR parameters only from fil
 No need to re-run IQ-TREE - we just select which existing IQ-TREE files to use.
 """
 
+import os
 import argparse
 from pathlib import Path
-from Bio import SeqIO
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 import re
 import pickle
 import pandas as pd
-import numpy as np
 
 # Dataset configurations
 DATASETS = {
@@ -33,6 +34,22 @@ DATASETS = {
 
 OUTPUT_DIR = Path('/groups/itay_mayrose/tomulanovski/gene2net/simulations/distributions')
 
+# Alignment quality stats and parsed IQ-TREE parameters from earlier runs,
+# keyed by alignment file
+CACHE_PATH = OUTPUT_DIR / 'alignment_cache.pkl'
+
+# IQ-TREE report header lines (input data, constant sites, informative sites),
+# matched in a single pass; compiled once, used for every file
+HEADER_INFO_RE = re.compile(
+    r'Input data:\s+(?P<n_sequences>\d+)\s+sequences?\s+with\s+(?P<alignment_length>\d+)\s+nucleotide sites'
+    r'|Number of constant sites:\s+(?P<constant_sites>\d+)'
+    r'|Number of parsimony informative sites:\s+(?P<informative_sites>\d+)'
+)
+
+# GTR rate labels in the IQ-TREE report and the parameter names we store them under
+RATE_KEYS = [('A-C', 'AC'), ('A-G', 'AG'), ('A-T', 'AT'), ('C-G', 'CG'), ('C-T', 'CT'), ('G-T', 'GT')]
+BASES = ['A', 'C', 'G', 'T']
+
 
 def parse_arguments():
     """Parse command-line arguments."""
@@ -56,6 +73,9 @@ def parse_arguments():
     parser.add_argument('--enable-filters', action='store_true',
                        help='Enable all quality filters with default values (length≥350, sequences≥15, gaps≤30%%, informative≥20%%, constant≤60%%)')
     
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Number of worker processes for reading alignments/IQ-TREE files. Default: all CPUs')
+    
     return parser.parse_args()
 
 
@@ -124,24 +144,12 @@ def extract_alignment_info_from_iqtree(iqtree_file):
         
         info = {}
         
-        # Extract number of sequences and sites
-        pattern = r'Input data:\s+(\d+)\s+sequences?\s+with\s+(\d+)\s+nucleotide sites'
-        match = re.search(pattern, content)
-        if match:
-            info['n_sequences'] = int(match.group(1))
-            info['alignment_length'] = int(match.group(2))
-        
-        # Extract number of constant sites
-        pattern = r'Number of constant sites:\s+(\d+)'
-        match = re.search(pattern, content)
-        if match:
-            info['constant_sites'] = int(match.group(1))
-        
-        # Extract number of parsimony informative sites
-        pattern = r'Number of parsimony informative sites:\s+(\d+)'
-        match = re.search(pattern, content)
-        if match:
-            info['informative_sites'] = int(match.group(1))
+        # Extract number of sequences and sites, constant sites and parsimony
+        # informative sites (first occurrence of each)
+        for match in HEADER_INFO_RE.finditer(content):
+            for key, value in match.groupdict().items():
+                if value is not None and key not in info:
+                    info[key] = int(value)
         
         # Calculate percentages if we have the data
         if 'alignment_length' in info:
@@ -152,23 +160,44 @@ def extract_alignment_info_from_iqtree(iqtree_file):
         
         return info
         
-    except Exception as e:
+    # Unreadable file, or a zero-length alignment in the header
+    except (OSError, ValueError, ZeroDivisionError):
         return {}
 
 
-def check_alignment_quality(alignment_file, iqtree_file, min_length, min_sequences, max_gaps, 
-                           min_informative, max_constant):
+def get_filter_failures(stats, min_length, min_sequences, max_gaps, min_informative, max_constant):
     """
-    Check if alignment meets quality criteria.
-    Returns (passes, stats_dict).
-    
-    If all filters are None, always returns True (no filtering).
+    Return the list of quality filters an alignment fails, as short
+    "name=value" strings (empty list if it passes or no filters are set).
+    Filters that are None are skipped.
     """
+    failures = []
+    if min_length is not None and stats['alignment_length'] < min_length:
+        failures.append(f"length={stats['alignment_length']}")
+    if min_sequences is not None and stats['n_sequences'] < min_sequences:
+        failures.append(f"n_seq={stats['n_sequences']}")
+    if max_gaps is not None and stats['gap_percentage'] > max_gaps:
+        failures.append(f"gaps={stats['gap_percentage']:.1f}%")
+    if min_informative is not None and stats['informative_percentage'] is not None and stats['informative_percentage'] < min_informative:
+        failures.append(f"informative={stats['informative_percentage']:.1f}%")
+    if max_constant is not None and stats['constant_percentage'] is not None and stats['constant_percentage'] > max_constant:
+        failures.append(f"constant={stats['constant_percentage']:.1f}%")
+    return failures
+
+
+def compute_alignment_stats(alignment_file, iqtree_file):
+    """
+    Compute the quality stats of an alignment (the filters are applied to these).
+    Returns stats_dict, or None if the alignment is empty or cannot be read.
+    """
+    # Imported here so that parsing-only use of this module does not pay for Biopython
+    from Bio import SeqIO
+    
     try:
         sequences = list(SeqIO.parse(alignment_file, 'fasta'))
         
         if not sequences:
-            return False, None
+            return None
         
         n_sequences = len(sequences)
         alignment_length = len(sequences[0].seq)
@@ -192,87 +221,143 @@ def check_alignment_quality(alignment_file, iqtree_file, min_length, min_sequenc
             'informative_sites': iqtree_info.get('informative_sites')
         }
         
-        # Check if any filtering is enabled
-        filtering_enabled = any([
-            min_length is not None,
-            min_sequences is not None,
-            max_gaps is not None,
-            min_informative is not None,
-            max_constant is not None
-        ])
-        
-        if not filtering_enabled:
-            # No filtering - accept all alignments
-            return True, stats
-        
-        # Apply only the filters that are set
-        passes = True
-        if min_length is not None:
-            passes = passes and (alignment_length >= min_length)
-        if min_sequences is not None:
-            passes = passes and (n_sequences >= min_sequences)
-        if max_gaps is not None:
-            passes = passes and (gap_percentage <= max_gaps)
-        if min_informative is not None and stats['informative_percentage'] is not None:
-            passes = passes and (stats['informative_percentage'] >= min_informative)
-        if max_constant is not None and stats['constant_percentage'] is not None:
-            passes = passes and (stats['constant_percentage'] <= max_constant)
-        
-        return passes, stats
+        return stats
         
     except Exception as e:
         print(f"Error reading {alignment_file}: {e}")
-        return False, None
+        return None
 
 
 def parse_iqtree_file(iqtree_file):
-    """Parse IQ-TREE output file to extract GTR+Gamma parameters."""
+    """Parse IQ-TREE output file to extract GTR+Gamma parameters.
+
+    Single line-by-line pass over the report: the rate block follows
+    "Rate parameter R:", the frequencies are consecutive "pi(X) = ..." lines
+    and alpha is on the "Gamma shape alpha:" line. All of these are in the
+    SUBSTITUTION PROCESS section, so reading stops once alpha is found or the
+    next section (MAXIMUM LIKELIHOOD TREE) starts.
+    """
     try:
+        rates = None   # values collected so far while inside the rate block
+        freqs = None   # values collected so far while inside the frequency block
+        rate_values = freq_values = alpha = None
+        
         with open(iqtree_file, 'r') as f:
-            content = f.read()
-        
-        params = {}
-        
-        # Extract GTR rate parameters
-        rate_pattern = r'Rate parameter R:\s+A-C:\s+([\d.]+)\s+A-G:\s+([\d.]+)\s+A-T:\s+([\d.]+)\s+C-G:\s+([\d.]+)\s+C-T:\s+([\d.]+)\s+G-T:\s+([\d.]+)'
-        rate_match = re.search(rate_pattern, content)
-        if rate_match:
-            params['AC'] = float(rate_match.group(1))
-            params['AG'] = float(rate_match.group(2))
-            params['AT'] = float(rate_match.group(3))
-            params['CG'] = float(rate_match.group(4))
-            params['CT'] = float(rate_match.group(5))
-            params['GT'] = float(rate_match.group(6))
-        else:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                
+                # Inside "Rate parameter R:" block: expect A-C ... G-T in order
+                if rates is not None:
+                    key, _, value = line.partition(':')
+                    if key == RATE_KEYS[len(rates)][0]:
+                        rates.append(float(value.split()[0]))
+                        if len(rates) == len(RATE_KEYS):
+                            rate_values, rates = rates, None
+                        continue
+                    rates = None
+                
+                # Inside frequency block: expect pi(A) ... pi(T) in order
+                if freqs is not None:
+                    key, _, value = line.partition('=')
+                    if key.rstrip() == f'pi({BASES[len(freqs)]})':
+                        freqs.append(float(value.split()[0]))
+                        if len(freqs) == len(BASES):
+                            freq_values, freqs = freqs, None
+                        continue
+                    freqs = None
+                
+                if rate_values is None and line.startswith('Rate parameter R:'):
+                    rates = []
+                elif freq_values is None and line.startswith('pi(A) ='):
+                    freqs = [float(line.partition('=')[2].split()[0])]
+                elif alpha is None and line.startswith('Gamma shape alpha:'):
+                    alpha = float(line.partition(':')[2].split()[0])
+                    if rate_values is not None and freq_values is not None:
+                        break
+                elif line.startswith('MAXIMUM LIKELIHOOD TREE') and rate_values is not None:
+                    break
+        
+        if rate_values is None or freq_values is None:
             return None
         
-        # Extract base frequencies
-        freq_pattern = r'pi\(A\) = ([\d.]+)\s+pi\(C\) = ([\d.]+)\s+pi\(G\) = ([\d.]+)\s+pi\(T\) = ([\d.]+)'
-        freq_match = re.search(freq_pattern, content)
-        if freq_match:
-            params['pi_A'] = float(freq_match.group(1))
-            params['pi_C'] = float(freq_match.group(2))
-            params['pi_G'] = float(freq_match.group(3))
-            params['pi_T'] = float(freq_match.group(4))
-        else:
-            return None
+        # GTR rate parameters and base frequencies
+        params = {name: value for (_, name), value in zip(RATE_KEYS, rate_values)}
+        params.update({f'pi_{base}': value for base, value in zip(BASES, freq_values)})
         
-        # Extract Gamma alpha parameter
-        alpha = None
-        alpha_pattern = r'Gamma shape alpha:\s+([\d.]+)'
-        alpha_match = re.search(alpha_pattern, content)
-        if alpha_match:
-            alpha = float(alpha_match.group(1))
+        # Gamma alpha parameter
+        if alpha is not None:
             params['alpha'] = alpha
             params['rate_model'] = 'Gamma'
         
         return params
         
-    except Exception as e:
+    # Unreadable file, or a rate/frequency/alpha line without a number
+    except (OSError, ValueError, IndexError) as e:
         print(f"Error parsing {iqtree_file}: {e}")
         return None
 
 
+def load_cache():
+    """Load the alignment cache written by a previous run ({} if there is none)."""
+    try:
+        with open(CACHE_PATH, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError) as e:
+        if CACHE_PATH.exists():
+            print(f"Warning: ignoring unreadable cache {CACHE_PATH}: {e}")
+        return {}
+
+
+def process_alignment(alignment_file, cached, dataset_name, iqtree_dir, filters):
+    """
+    Quality-check one alignment and parse its IQ-TREE parameters.
+    Runs in a worker process; filters is (min_length, min_sequences, max_gaps,
+    min_informative, max_constant). cached is this alignment's entry from the
+    cache or None. An entry is a dict with 'key' (IQ-TREE path and the
+    alignment's and IQ-TREE file's mtimes), 'stats' and, once parsed, 'params'.
+    
+    Returns (gene_id, iqtree_path, passes, stats, params, cache_entry).
+    iqtree_path is None if no IQ-TREE file was found; params is only set for
+    passing alignments, cache_entry whenever stats could be computed.
+    """
+    # Extract gene ID
+    gene_id = extract_gene_id(alignment_file, dataset_name)
+    if not gene_id:
+        return None, None, False, None, None, None
+    
+    # Get corresponding IQ-TREE file first (we need it for filtering now)
+    iqtree_path = find_iqtree_file(gene_id, iqtree_dir, dataset_name)
+    if not iqtree_path or not iqtree_path.exists():
+        return gene_id, None, False, None, None, None
+    
+    # Reuse the stats (and parameters) from the last run if neither the
+    # alignment nor its IQ-TREE file has changed since, so nothing is read
+    key = (str(iqtree_path), alignment_file.stat().st_mtime_ns, iqtree_path.stat().st_mtime_ns)
+    if cached and cached['key'] == key:
+        entry = cached
+    else:
+        # Alignment quality stats (now including informative/constant sites)
+        entry = {'key': key, 'stats': compute_alignment_stats(alignment_file, iqtree_path)}
+    
+    # Filters are applied to the stats on every run, as they may differ; only
+    # the ones that are set are applied (none set - accept all alignments)
+    stats = entry['stats']
+    passes = bool(stats) and not get_filter_failures(stats, *filters)
+    
+    params = None
+    if passes:
+        # Parse GTR parameters (only needed, and cached, for passing alignments)
+        if 'params' not in entry:
+            entry = dict(entry, params=parse_iqtree_file(iqtree_path))
+        # main() adds per-gene fields to params, so hand it a copy
+        params = dict(entry['params']) if entry['params'] else None
+    
+    cache_entry = entry if stats else None
+    return gene_id, iqtree_path, passes, stats, params, cache_entry
+
+
 def main():
     """Main execution function."""
     args = parse_arguments()
@@ -320,78 +405,78 @@ def main():
     
     print("="*70 + "\n")
     
+    filters = (args.min_length, args.min_sequences, args.max_gaps,
+               args.min_informative, args.max_constant)
+    
     # Process each dataset
     all_parameters = {}
     filter_stats = []
+    # Alpha values are gathered column-wise as genes are processed, so the
+    # per-dataset and combined summaries never rebuild frames from the dicts
+    alpha_columns = {'dataset': [], 'alpha': []}
+    cache = load_cache()
+    cache_changed = False
     
     for dataset_name, dataset_config in DATASETS.items():
         print(f"Processing {dataset_name}...")
         
-        alignment_dir = Path(dataset_config['alignment_dir'])
-        extensions = dataset_config['extensions']
+        alignment_dir = dataset_config['alignment_dir']
+        extensions = tuple(dataset_config['extensions'])
         
-        # Find all alignment files with any of the extensions
+        # Find all alignment files with any of the extensions (one directory pass)
         alignment_files = []
-        for ext in extensions:
-            alignment_files.extend(list(alignment_dir.glob(f'*{ext}')))
+        if os.path.isdir(alignment_dir):
+            with os.scandir(alignment_dir) as entries:
+                alignment_files = sorted(
+                    Path(entry.path) for entry in entries
+                    if entry.name.endswith(extensions) and not entry.name.startswith('.')
+                    and entry.is_file()
+                )
         
         print(f"  Found {len(alignment_files)} alignment files")
         
         passed_alignments = []
         failed_alignments = []
         parameters_list = []
+        dataset_alphas = []
         
-        for alignment_file in alignment_files:
-            # Extract gene ID
-            gene_id = extract_gene_id(alignment_file, dataset_name)
+        # Files are independent, so read and parse them in parallel
+        worker = partial(process_alignment, dataset_name=dataset_name,
+                         iqtree_dir=dataset_config['iqtree_dir'], filters=filters)
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            cached = [cache.get(str(alignment_file)) for alignment_file in alignment_files]
+            results = list(executor.map(worker, alignment_files, cached, chunksize=32))
+        
+        for alignment_file, (gene_id, iqtree_path, passes, stats, params, cache_entry) in zip(alignment_files, results):
             if not gene_id:
                 continue
             
-            # Get corresponding IQ-TREE file first (we need it for filtering now)
-            iqtree_path = find_iqtree_file(gene_id, dataset_config['iqtree_dir'], dataset_name)
+            if cache_entry and cache.get(str(alignment_file)) != cache_entry:
+                cache[str(alignment_file)] = cache_entry
+                cache_changed = True
             
-            if not iqtree_path or not iqtree_path.exists():
+            if iqtree_path is None:
                 failed_alignments.append((gene_id, 'IQ-TREE file not found'))
                 continue
             
-            # Check alignment quality (now including informative/constant sites)
-            passes, stats = check_alignment_quality(
-                alignment_file,
-                iqtree_path,
-                args.min_length, 
-                args.min_sequences, 
-                args.max_gaps,
-                args.min_informative,
-                args.max_constant
-            )
-            
             if passes and stats:
-                # Parse GTR parameters
-                params = parse_iqtree_file(iqtree_path)
-                
                 if params:
                     params['source_file'] = str(iqtree_path)
                     params['alignment_file'] = str(alignment_file)
                     params['gene_id'] = gene_id
                     params.update(stats)
                     parameters_list.append(params)
+                    if 'alpha' in params:
+                        dataset_alphas.append(params['alpha'])
                     passed_alignments.append((gene_id, stats))
             else:
                 if stats and filtering_active:
-                    reason = []
-                    if args.min_length is not None and stats['alignment_length'] < args.min_length:
-                        reason.append(f"length={stats['alignment_length']}")
-                    if args.min_sequences is not None and stats['n_sequences'] < args.min_sequences:
-                        reason.append(f"n_seq={stats['n_sequences']}")
-                    if args.max_gaps is not None and stats['gap_percentage'] > args.max_gaps:
-                        reason.append(f"gaps={stats['gap_percentage']:.1f}%")
-                    if args.min_informative is not None and stats['informative_percentage'] is not None and stats['informative_percentage'] < args.min_informative:
-                        reason.append(f"informative={stats['informative_percentage']:.1f}%")
-                    if args.max_constant is not None and stats['constant_percentage'] is not None and stats['constant_percentage'] > args.max_constant:
-                        reason.append(f"constant={stats['constant_percentage']:.1f}%")
+                    reason = get_filter_failures(stats, *filters)
                     failed_alignments.append((gene_id, ', '.join(reason)))
         
         all_parameters[dataset_name] = parameters_list
+        alpha_columns['dataset'].extend([dataset_name] * len(dataset_alphas))
+        alpha_columns['alpha'].extend(dataset_alphas)
         
         # Report statistics
         n_passed = len(passed_alignments)
@@ -406,10 +491,10 @@ def main():
             if n_failed > 0:
                 print(f"  ⚠ Skipped (missing IQ-TREE): {n_failed}")
         
-        if parameters_list:
-            df = pd.DataFrame(parameters_list)
-            print(f"  Alpha range: [{df['alpha'].min():.2f}, {df['alpha'].max():.2f}]")
-            print(f"  Alpha mean: {df['alpha'].mean():.2f}, median: {df['alpha'].median():.2f}")
+        if dataset_alphas:
+            alphas = pd.Series(dataset_alphas)
+            print(f"  Alpha range: [{alphas.min():.2f}, {alphas.max():.2f}]")
+            print(f"  Alpha mean: {alphas.mean():.2f}, median: {alphas.median():.2f}")
         
         filter_stats.append({
             'Dataset': dataset_name,
@@ -440,31 +525,49 @@ def main():
         pickle.dump(all_parameters, f)
     print(f"✓ GTR parameters saved to {pkl_path}")
     
+    # Keep stats and parsed IQ-TREE parameters for the next run (entries from
+    # earlier runs are kept, they are checked by mtime anyway); the file is
+    # only rewritten if something changed
+    if cache_changed:
+        with open(CACHE_PATH, 'wb') as f:
+            pickle.dump(cache, f)
+        print(f"✓ Alignment cache saved to {CACHE_PATH}")
+    
     # Compare alpha distributions
     print("\n" + "="*70)
     print("ALPHA DISTRIBUTION COMPARISON")
     print("="*70 + "\n")
     
-    for dataset_name, params_list in all_parameters.items():
-        if params_list:
-            alphas = [p['alpha'] for p in params_list if 'alpha' in p]
-            if alphas:
-                print(f"{dataset_name}:")
-                print(f"  N genes: {len(alphas)}")
-                print(f"  Alpha: mean={np.mean(alphas):.3f}, median={np.median(alphas):.3f}")
-                print(f"  Alpha: min={np.min(alphas):.3f}, max={np.max(alphas):.3f}")
-                print(f"  Alpha > 3.0: {sum(1 for a in alphas if a > 3.0)} genes")
-                print()
-    
-    # Summary
-    all_alphas = [p['alpha'] for params in all_parameters.values() 
-                  for p in params if 'alpha' in p]
-    
-    if all_alphas:
+    # One table of all alpha values, summarized per dataset in a single groupby
+    # (dataset names repeat for every gene, so store them as a categorical)
+    alpha_df = pd.DataFrame(alpha_columns).astype({'dataset': 'category'})
+    alpha_df['high_alpha'] = alpha_df['alpha'] > 3.0
+    alpha_summary = alpha_df.groupby('dataset', sort=False, observed=True).agg(
+        n=('alpha', 'size'),
+        mean=('alpha', 'mean'),
+        median=('alpha', 'median'),
+        min=('alpha', 'min'),
+        max=('alpha', 'max'),
+        n_high=('high_alpha', 'sum')
+    )
+    
+    for row in alpha_summary.itertuples():
+        print(f"{row.Index}:")
+        print(f"  N genes: {row.n}")
+        print(f"  Alpha: mean={row.mean:.3f}, median={row.median:.3f}")
+        print(f"  Alpha: min={row.min:.3f}, max={row.max:.3f}")
+        print(f"  Alpha > 3.0: {row.n_high} genes")
+        print()
+    
+    # Summary (reuses the alpha table and its > 3.0 mask)
+    all_alphas = alpha_df['alpha']
+    
+    if not all_alphas.empty:
+        n_high = int(alpha_df['high_alpha'].sum())
         print(f"Combined ({len(all_alphas)} genes):")
-        print(f"  Alpha: mean={np.mean(all_alphas):.3f}, median={np.median(all_alphas):.3f}")
-        print(f"  Alpha: min={np.min(all_alphas):.3f}, max={np.max(all_alphas):.3f}")
-        print(f"  Alpha > 3.0: {sum(1 for a in all_alphas if a > 3.0)} genes ({100*sum(1 for a in all_alphas if a > 3.0)/len(all_alphas):.1f}%)")
+        print(f"  Alpha: mean={all_alphas.mean():.3f}, median={all_alphas.median():.3f}")
+        print(f"  Alpha: min={all_alphas.min():.3f}, max={all_alphas.max():.3f}")
+        print(f"  Alpha > 3.0: {n_high} genes ({100*n_high/len(all_alphas):.1f}%)")
     
     suffix_text = suffix.replace('_', ' ')
     print(f"\n✓ Done! Use gtr_parameters{suffix}.pkl for your simulations.")